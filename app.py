@@ -1,25 +1,86 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from postal_route_optimizer import PostalRouteOptimizer
-import tempfile
+from jobs import JobManager
+from session_store import get_default_job_store, get_default_session_store
+from map_cache import MapCache
+from plan_export import EXPORT_FORMATS, plan_rows, iter_csv, export_binary
+from instrumentation import REGISTRY, instrument_run
+from providers import load_environment, preload_in_background
 import os
 
+# .env settings apply to the stores and caches created below
+load_environment()
+# Load scikit-learn while the server starts taking requests rather than on the first optimize
+preload_in_background()
+
 app = Flask(__name__)
 
-# Global storage to maintain state between requests
-# Stores the current optimizer instance and route data
-current_session = {
-    'optimizer': None,
-    'routes': None,
-    'start_postal': None,
-    'status': None
-}
+# Plans (start point, routes, coordinates) keyed by session id, so concurrent
+# users don't overwrite each other; SESSION_STORE=sqlite shares them across workers
+session_store = get_default_session_store()
+
+# Background optimize runs; MAX_CONCURRENT_JOBS caps how many run at once. With
+# SESSION_STORE=sqlite their status is shared too, so any worker can answer a poll
+job_manager = JobManager(store=get_default_job_store())
+
+# Rendered maps live in static/maps/<hash of start, route and options>.html,
+# bounded by MAP_CACHE_MAX_MB and MAP_CACHE_MAX_AGE_HOURS
+map_cache = MapCache()
+map_cache.remove_legacy_maps()
+# Options that change how a map looks; part of each map's cache key
+MAP_OPTIONS = {'profile': 'driving-car'}
+
+def render_route_map(start_postal, route, get_optimizer):
+    """Filename of the route's map under static/, rendering it only if it isn't cached"""
+    def render():
+        optimizer = get_optimizer()
+        route_map = optimizer.create_route_map(route)
+        # Maps with straight-line fallback legs aren't cached, so they're redrawn once ORS is back
+        return route_map, optimizer.map_fallback_legs == 0
+
+    return map_cache.get_or_render(start_postal, route, render, options=MAP_OPTIONS)
 
 # Main route - serves the web interface
 @app.route('/', methods=['GET'])
 def home():
     return render_template('index.html')
 
-# API endpoint for optimizing routes
+def run_optimization(job, postal_codes, num_groups, start_postal, include_metrics=False):
+    """Runs in a job worker thread: geocoding, clustering, routing, then the first map"""
+    with instrument_run() as run_metrics:
+        # First phase - Geocoding (progress is reported back through job.report)
+        optimizer = PostalRouteOptimizer(
+            postal_codes,
+            num_groups=num_groups,
+            progress_callback=job.report
+        )
+
+        # Second phase - Route Processing
+        routes = optimizer.optimize_route(start_postal)
+
+        # Store the plan (not the optimizer) for later use when switching between routes
+        session_store.put(job.id, optimizer.to_plan())
+
+        # The first route's map data (markers and encoded leg polylines) is built once, here,
+        # so polls never fetch directions
+        map_data = None
+        if routes:
+            job.report('rendering', 0.0)
+            map_data = optimizer.route_map_data(routes[0])
+
+    # Only a summary and the first map stay on the job; routes are fetched from /plans/<session_id>
+    result = {
+        'session_id': job.id,
+        'total_codes': len(postal_codes),
+        'total_days': len(routes),
+        'map_data': map_data
+    }
+    # Optional per-stage timings, network calls, cache hit ratios and retries for this run
+    if include_metrics:
+        result['metrics'] = run_metrics.to_dict()
+    return result
+
+# API endpoint for optimizing routes - queues a background job and returns its id
 @app.route('/optimize', methods=['POST'])
 def optimize():
     try:
@@ -31,39 +92,13 @@ def optimize():
         num_groups = int(data['num_groups'])
         start_postal = data['start_postal'].strip()
 
-        # First phase - Geocoding
-        current_session['status'] = 'geocoding'
-        optimizer = PostalRouteOptimizer(postal_codes, num_groups=num_groups)
-        
-        # Second phase - Route Processing
-        current_session['status'] = 'processing'
-        routes = optimizer.optimize_route(start_postal)
-
-        # Store in session for later use when switching between routes
-        current_session['optimizer'] = optimizer
-        current_session['routes'] = routes
-        current_session['start_postal'] = start_postal
-
-        # Generate map for the first route
-        if routes:
-            route_map = optimizer.create_route_map(routes[0])
-            if route_map:
-                # Save map as temporary HTML file
-                _, map_path = tempfile.mkstemp(suffix='.html', dir='static')
-                map_filename = os.path.basename(map_path)
-                route_map.save(f'static/{map_filename}')
-            else:
-                map_filename = None
-        else:
-            map_filename = None
-
-        # Return JSON response with all route data
+        job = job_manager.submit(
+            run_optimization, postal_codes, num_groups, start_postal,
+            include_metrics=bool(data.get('metrics', False))
+        )
         return jsonify({
             'success': True,
-            'routes': routes,
-            'total_codes': len(postal_codes),
-            'total_days': len(routes),
-            'map_filename': map_filename
+            'job_id': job.id
         })
     except Exception as e:
         return jsonify({
@@ -71,29 +106,69 @@ def optimize():
             'error': str(e)
         })
 
+# API endpoint for polling a job's phase, percent complete and elapsed time
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    response = job_manager.status(job_id)
+    if response is None:
+        return jsonify({
+            'success': False,
+            'error': "Unknown job"
+        }), 404
+
+    response['success'] = response['status'] != 'failed'
+    return jsonify(response)
+
+# API endpoint for a stored plan's routes, fetched once when its job is done
+@app.route('/plans/<session_id>', methods=['GET'])
+def get_plan(session_id):
+    plan = session_store.get(session_id)
+    if plan is None:
+        return jsonify({
+            'success': False,
+            'error': "This plan has expired; please optimize again"
+        }), 404
+    return jsonify({
+        'success': True,
+        'start_postal': plan.start_postal,
+        'routes': plan.routes()
+    })
+
+# API endpoint for cancelling a queued or running job
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    state = job_manager.cancel(job_id)
+    if state is None:
+        return jsonify({
+            'success': False,
+            'error': "Unknown job"
+        }), 404
+    return jsonify({
+        'success': True,
+        'job_id': state['job_id'],
+        'status': state['status']
+    })
+
 # API endpoint for getting maps of specific routes
 @app.route('/get_route_map', methods=['POST'])
 def get_route_map():
     try:
         data = request.json
         route_index = int(data['route_index'])
+        plan = session_store.get(data.get('session_id', ''))
         
         # Validate that we have route data available
-        if (current_session['optimizer'] is None or 
-            current_session['routes'] is None or 
-            route_index >= len(current_session['routes'])):
+        if plan is None or route_index >= len(plan):
             raise ValueError("No valid route data available")
 
-        # Generate new map for selected route
-        route_map = current_session['optimizer'].create_route_map(
-            current_session['routes'][route_index]
+        # Serve the cached map, or render it from the stored coordinates
+        map_filename = render_route_map(
+            plan.start_postal,
+            plan.route(route_index),
+            lambda: PostalRouteOptimizer.from_plan(plan)
         )
         
-        if route_map:
-            # Save new map as temporary HTML file
-            _, map_path = tempfile.mkstemp(suffix='.html', dir='static')
-            map_filename = os.path.basename(map_path)
-            route_map.save(f'static/{map_filename}')
+        if map_filename:
             return jsonify({
                 'success': True,
                 'map_filename': map_filename
@@ -110,29 +185,79 @@ def get_route_map():
             'error': str(e)
         })
 
-# Add this route to app.py
-@app.route('/export_csv', methods=['POST'])
-def export_csv():
+# API endpoint for a route's markers and leg polylines as JSON, drawn by the page's Leaflet map
+@app.route('/get_route_data', methods=['POST'])
+def get_route_data():
     try:
         data = request.json
-        routes = data['routes']
-        
-        # Create CSV content with comma-separated postal codes
-        csv_content = "Route Number,Postal Codes\n"
-        for i, route in enumerate(routes, 1):
-            csv_content += f"Route {i},{','.join(route)}\n"  # Changed from ' -> ' to ','
-            
-        return jsonify({
+        route_index = int(data['route_index'])
+        plan = session_store.get(data.get('session_id', ''))
+
+        # Validate that we have route data available
+        if plan is None or route_index >= len(plan):
+            raise ValueError("No valid route data available")
+
+        with instrument_run() as run_metrics:
+            optimizer = PostalRouteOptimizer.from_plan(plan)
+            map_data = optimizer.route_map_data(
+                plan.route(route_index),
+                format=data.get('format', 'polyline')
+            )
+        if map_data is None:
+            raise ValueError("Not enough geocoded stops to draw this route")
+        response = {
             'success': True,
-            'csv_content': csv_content,
-            'filename': 'postal_routes.csv'
-        })
+            'map_data': map_data
+        }
+        if data.get('metrics'):
+            response['metrics'] = run_metrics.to_dict()
+        return jsonify(response)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
+# Process-wide stage timings, network calls, retries and cache hits in Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# API endpoint for map cache hit/miss counters and disk usage
+@app.route('/maps/stats', methods=['GET'])
+def map_cache_stats():
+    return jsonify(map_cache.summary())
+
+# API endpoint for downloading a stored plan with one row per stop, streamed as CSV
+# (or built as Parquet/XLSX when pandas is installed)
+@app.route('/export/<session_id>', methods=['GET'])
+def export_plan(session_id):
+    file_format = request.args.get('format', 'csv')
+    plan = session_store.get(session_id)
+    if plan is None:
+        return jsonify({
+            'success': False,
+            'error': "No valid route data available"
+        }), 404
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown export format '{file_format}'"
+        }), 400
+
+    mimetype = EXPORT_FORMATS[file_format][0]
+    headers = {'Content-Disposition': f'attachment; filename=postal_routes.{file_format}'}
+    if file_format == 'csv':
+        return Response(stream_with_context(iter_csv(plan_rows(plan))), mimetype=mimetype, headers=headers)
+    try:
+        content = export_binary(plan_rows(plan), file_format)
+    except ImportError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 501
+    return Response(content, mimetype=mimetype, headers=headers)
+
 if __name__ == '__main__':
     os.makedirs('static', exist_ok=True)
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import map_in_context, record_network_call, record_retry
+
+ONEMAP_URL = "https://www.onemap.gov.sg/api/common/elastic/search"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# Singapore bounding box as (min_lon, max_lat, max_lon, min_lat) for Nominatim's viewbox
+SINGAPORE_VIEWBOX = "103.6,1.5,104.1,1.1"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchGeocoder:
+    """
+    Concurrent geocoding engine:
+    - thread pool sharing one Session with a pooled keep-alive connection per worker
+    - separate token-bucket rate limit per provider (OneMap, Nominatim)
+    - identical codes in a batch are geocoded once
+    - results come back in input order
+    Provider URLs can point at a local stub server for testing.
+    """
+
+    def __init__(self, onemap_url=None, nominatim_url=None, onemap_rate=4.0,
+                 nominatim_rate=1.0, max_workers=8, timeout=10, max_retries=2,
+                 user_agent="postal_route_optimizer"):
+        self.onemap_url = onemap_url or os.getenv('ONEMAP_URL', ONEMAP_URL)
+        self.nominatim_url = nominatim_url or os.getenv('NOMINATIM_URL', NOMINATIM_URL)
+        self.limits = {
+            'onemap': TokenBucket(onemap_rate),
+            'nominatim': TokenBucket(nominatim_rate)
+        }
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.user_agent = user_agent
+        self._http = None
+        self._session_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _session(self):
+        """Return the shared Session, whose connection pool holds one keep-alive socket per worker"""
+        with self._session_lock:
+            if self._http is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = self.user_agent
+                self._http = session
+            return self._http
+
+    def _get(self, provider, url, params):
+        """Rate-limited GET that backs off and retries when the provider returns 429"""
+        for attempt in range(self.max_retries + 1):
+            self.limits[provider].acquire()
+            started = time.perf_counter()
+            try:
+                response = self._session().get(url, params=params, timeout=self.timeout)
+            except Exception:
+                record_network_call(provider, time.perf_counter() - started, ok=False)
+                raise
+            record_network_call(provider, time.perf_counter() - started, ok=response.status_code < 400)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            record_retry(provider)
+            delay = response.headers.get('Retry-After')
+            time.sleep(float(delay) if delay and delay.isdigit() else 2 ** attempt)
+        return response
+
+    def _geocode_onemap(self, postal_code):
+        params = {
+            'searchVal': postal_code,
+            'returnGeom': 'Y',
+            'getAddrDetails': 'Y'
+        }
+        response = self._get('onemap', self.onemap_url, params)
+        if response.status_code != 200:
+            print(f"OneMap API returned status code: {response.status_code}")
+            return None
+        results = response.json().get('results')
+        if not results:
+            print(f"No results found for postal code: {postal_code}")
+            return None
+        result = results[0]
+        return {
+            'lat': float(result['LATITUDE']),
+            'lon': float(result['LONGITUDE']),
+            'source': 'onemap',
+            'address': result.get('ADDRESS', 'No address found')
+        }
+
+    def _geocode_nominatim(self, postal_code):
+        params = {
+            'q': f"Singapore {postal_code}",
+            'format': 'json',
+            'countrycodes': 'sg',
+            'viewbox': SINGAPORE_VIEWBOX,
+            'limit': 1
+        }
+        response = self._get('nominatim', self.nominatim_url, params)
+        if response.status_code != 200:
+            print(f"Nominatim returned status code: {response.status_code}")
+            return None
+        results = response.json()
+        if not results:
+            return None
+        return {
+            'lat': float(results[0]['lat']),
+            'lon': float(results[0]['lon']),
+            'source': 'nominatim',
+            'address': results[0].get('display_name')
+        }
+
+    def geocode(self, postal_code):
+        """
+        Geocode a single postal code using:
+        1. OneMap API (Singapore's official service)
+        2. Fallback to Nominatim if OneMap fails
+        Returns a record with lat, lon, source and address, or None
+        """
+        try:
+            record = self._geocode_onemap(postal_code)
+            if record:
+                return record
+        except Exception as e:
+            print(f"OneMap API failed for {postal_code}: {str(e)}")
+
+        try:
+            record = self._geocode_nominatim(postal_code)
+            if record:
+                return record
+        except Exception as e:
+            print(f"Fallback geocoding failed for {postal_code}: {str(e)}")
+
+        print(f"All geocoding attempts failed for {postal_code}")
+        return None
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='geocoder'
+                )
+            return self._executor
+
+    def geocode_many(self, postal_codes):
+        """Geocode a batch concurrently, returning records aligned with postal_codes"""
+        unique_codes = list(dict.fromkeys(postal_codes))
+        if not unique_codes:
+            return []
+        results = dict(zip(unique_codes, map_in_context(self._pool(), self.geocode, unique_codes)))
+        return [results[code] for code in postal_codes]
+
+    def close(self):
+        """Shut down the worker pool and close pooled connections"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        with self._session_lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
+
+# One engine per process so rate limits and connection pools are shared
+_default_geocoder = None
+_default_geocoder_lock = threading.Lock()
+
+
+def get_default_geocoder():
+    """Return the process-wide BatchGeocoder, creating it on first use"""
+    global _default_geocoder
+    with _default_geocoder_lock:
+        if _default_geocoder is None:
+            _default_geocoder = BatchGeocoder()
+        return _default_geocoder
@@ -0,0 +1,123 @@
+"""
+Compare the KMeans-then-slice pipeline with mini-batch and balanced clustering.
+Reports route count, route size spread and runtime of optimize_route, then how
+many stops keep their cluster on a similar next day (5% of stops replaced) with
+mini-batch clustering from scratch and warm-started from the first day's centroids.
+Balanced clustering is also run on stop lists with repeated postal codes and
+must still return exactly --routes routes.
+
+    python benchmarks/bench_clustering.py --sizes 1000 10000 50000 --routes 20
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic import offline_geocoding, synthetic_stops
+from postal_route_optimizer import PostalRouteOptimizer
+
+# Share of stops replaced between the two days of the stability check
+CHURN = 0.05
+
+
+def with_repeats(codes, seed):
+    """codes with about a third of them repeated 2-5 times, like several deliveries to one building"""
+    rng = np.random.default_rng(seed)
+    counts = np.where(rng.random(len(codes)) < 1 / 3, rng.integers(2, 6, len(codes)), 1)
+    return [code for code, count in zip(codes, counts) for _ in range(count)]
+
+
+def run_once(codes, geocoding, num_routes, clustering, label=None):
+    optimizer = PostalRouteOptimizer(codes, num_groups=num_routes, clustering=clustering, **geocoding)
+    started = time.perf_counter()
+    routes = optimizer.optimize_route(codes[0])
+    elapsed = time.perf_counter() - started
+    sizes = np.array([len(route) for route in routes])
+    return {
+        'clustering': label or clustering,
+        'stops': len(codes),
+        'requested_routes': num_routes,
+        'routes': len(routes),
+        'min_size': int(sizes.min()),
+        'max_size': int(sizes.max()),
+        'size_variance': float(sizes.var()),
+        'seconds': round(elapsed, 3)
+    }
+
+
+def cluster_labels(codes, geocoding, num_routes, warm_start):
+    """{postal code: cluster label} and clustering seconds for one mini-batch run"""
+    optimizer = PostalRouteOptimizer(codes, num_groups=num_routes, clustering='minibatch',
+                                     warm_start=warm_start, **geocoding)
+    optimizer.start_postal = codes[0]
+    started = time.perf_counter()
+    clusters = optimizer.cluster_postal_codes()
+    elapsed = time.perf_counter() - started
+    return {code: label for label, members in clusters.items() for code in members}, elapsed
+
+
+def stability_once(codes, geocoding, num_routes, warm_start):
+    """Cluster day one, then day two with CHURN of its stops replaced by new ones"""
+    size = int(len(codes) / (1 + CHURN))
+    depot = codes[0]
+    day_one = codes[:size]
+    day_two = [depot] + codes[len(codes) - size + 1:]
+    first, _ = cluster_labels(day_one, geocoding, num_routes, warm_start)
+    second, elapsed = cluster_labels(day_two, geocoding, num_routes, warm_start)
+    shared = [code for code in day_two if code in first]
+    kept = sum(first[code] == second[code] for code in shared)
+    return {
+        'clustering': 'minibatch-warm' if warm_start else 'minibatch-cold',
+        'stops': size,
+        'shared_stops': len(shared),
+        'kept_cluster': round(kept / len(shared), 4),
+        'seconds': round(elapsed, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--routes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'stops':>7} {'mode':>9} {'routes':>7} {'min':>6} {'max':>6} {'variance':>12} {'seconds':>8}")
+    for size in args.sizes:
+        codes, coords = synthetic_stops(size, seed=args.seed)
+        with tempfile.TemporaryDirectory() as workdir:
+            geocoding = offline_geocoding(codes, coords, workdir)
+            runs = [(codes, clustering, None) for clustering in ('kmeans', 'minibatch', 'balanced')]
+            runs.append((with_repeats(codes, args.seed), 'balanced', 'bal-dups'))
+            for stops, clustering, label in runs:
+                result = run_once(stops, geocoding, args.routes, clustering, label)
+                results.append(result)
+                print(f"{result['stops']:>7} {result['clustering']:>9} {result['routes']:>7} {result['min_size']:>6} "
+                      f"{result['max_size']:>6} {result['size_variance']:>12.1f} {result['seconds']:>8.2f}")
+                if clustering == 'balanced':
+                    # Repeated stops must not push a cluster past group_size into an extra route
+                    assert result['routes'] == args.routes, f"balanced gave {result['routes']} routes"
+
+    print(f"\n{'stops':>7} {'mode':>15} {'shared':>7} {'kept':>7} {'seconds':>8}")
+    for size in args.sizes:
+        # One pool of codes: day one is its head, day two drops CHURN of those and adds its tail
+        codes, coords = synthetic_stops(int(size * (1 + CHURN)), seed=args.seed)
+        with tempfile.TemporaryDirectory() as workdir:
+            geocoding = offline_geocoding(codes, coords, workdir)
+            for warm_start in (False, True):
+                result = stability_once(codes, geocoding, args.routes, warm_start)
+                results.append(result)
+                print(f"{result['stops']:>7} {result['clustering']:>15} {result['shared_stops']:>7} "
+                      f"{result['kept_cluster']:>7.1%} {result['seconds']:>8.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Time a full re-plan against apply_changes for a small change to an existing plan.
+
+    python benchmarks/bench_incremental.py --stops 5000 --routes 20 --change 0.05
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic import offline_geocoding, synthetic_stops
+from postal_route_optimizer import PostalRouteOptimizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, default=5000)
+    parser.add_argument('--routes', type=int, default=20)
+    parser.add_argument('--change', type=float, default=0.05, help="Fraction of stops removed and added")
+    parser.add_argument('--clustering', default='balanced')
+    parser.add_argument('--local-search', default='2opt+oropt', help="Local search used by both runs")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    changed = int(args.stops * args.change / 2)
+    codes, coords = synthetic_stops(args.stops + changed, seed=args.seed)
+    start_postal = codes[0]
+    initial_codes, added = codes[:args.stops], codes[args.stops:]
+    rng = np.random.default_rng(args.seed)
+    removed = [initial_codes[i] for i in rng.choice(np.arange(1, args.stops), changed, replace=False)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        geocoding = offline_geocoding(codes, coords, workdir)
+        optimizer = PostalRouteOptimizer(initial_codes, num_groups=args.routes,
+                                         clustering=args.clustering, local_search=args.local_search,
+                                         **geocoding)
+        before = [list(route) for route in optimizer.optimize_route(start_postal)]
+
+        started = time.perf_counter()
+        after = optimizer.apply_changes(added=added, removed=removed)
+        incremental = time.perf_counter() - started
+
+        final_codes = [code for code in initial_codes if code not in set(removed)] + added
+        replanner = PostalRouteOptimizer(final_codes, num_groups=args.routes,
+                                         clustering=args.clustering, local_search=args.local_search,
+                                         **geocoding)
+        started = time.perf_counter()
+        replanner.optimize_route(start_postal)
+        full = time.perf_counter() - started
+
+    unchanged = sum(1 for route in after if route in before)
+    route_before = {code: i for i, route in enumerate(before) for code in route}
+    route_after = {code: i for i, route in enumerate(after) for code in route}
+    kept = [code for code in route_before if code in route_after]
+    same_route = sum(1 for code in kept if route_before[code] == route_after[code])
+    planned = sum(len(route) for route in after)
+    print(f"Removed {len(removed)} and added {len(added)} of {args.stops} stops")
+    print(f"Full re-plan:  {full:.3f}s")
+    print(f"Incremental:   {incremental:.3f}s ({incremental / full:.1%} of a full re-plan)")
+    print(f"Unchanged routes: {unchanged}/{len(after)}, stops kept on their route: {same_route}/{len(kept)}")
+    print(f"Stops planned: {planned}/{len(final_codes)}")
+
+
+if __name__ == "__main__":
+    main()
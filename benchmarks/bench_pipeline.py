@@ -0,0 +1,186 @@
+"""
+Benchmark the routing pipeline stage by stage on synthetic Singapore stop sets.
+Geocoding is served from a gazetteer built from the synthetic coordinates,
+so runs are deterministic and never touch the network.
+
+For every size it reports wall time and peak traced memory for each stage of
+the current optimizer (geocode, cluster, route clusters, full optimize_route)
+and for the greedy-search baseline, plus route count and total tour length.
+
+    python benchmarks/bench_pipeline.py --sizes 100 1000 10000 100000 --json pipeline.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from synthetic import offline_geocoding, synthetic_stops
+from distance_matrix import haversine_pairs
+from postal_route_optimizer import PostalRouteOptimizer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GREEDY_PATH = os.path.join(REPO_DIR, 'postal_route_optimizer - greedy search.py')
+
+
+def load_greedy_optimizer():
+    """The greedy-search variant lives in a file whose name isn't importable"""
+    spec = importlib.util.spec_from_file_location('greedy_search', GREEDY_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.PostalRouteOptimizer
+
+
+def measure(fn, memory):
+    """Run fn(), returning (result, seconds, peak MB or None)"""
+    if memory:
+        tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def tour_length_km(routes, start_postal, coordinates):
+    """Straight-line km of every route, each starting from start_postal"""
+    total = 0.0
+    for route in routes:
+        stops = [coordinates[code] for code in [start_postal] + list(route) if code in coordinates]
+        if len(stops) > 1:
+            stops = np.asarray(stops)
+            total += float(haversine_pairs(stops[:-1], stops[1:]).sum())
+    return total
+
+
+def current_stages(codes, start_postal, geocoding, options):
+    """Stage callables for the current optimizer, run in order on shared state"""
+    state = {}
+
+    def geocode():
+        state['optimizer'] = PostalRouteOptimizer(codes, **options, **geocoding)
+        return state['optimizer'].get_coordinates(codes)
+
+    def cluster():
+        state['clusters'] = state['optimizer'].cluster_postal_codes()
+        return state['clusters']
+
+    def route_clusters():
+        optimizer = state['optimizer']
+        optimizer.resolver.resolve(start_postal)
+        if optimizer.clustering == 'sector':
+            return optimizer.route_sectors(state['clusters'], start_postal)
+        return list(optimizer.route_all_clusters(state['clusters'].values(), start_postal))
+
+    def optimize_route():
+        # End to end on a fresh optimizer; geocoding still comes from the offline gazetteer
+        return PostalRouteOptimizer(codes, **options, **geocoding).optimize_route(start_postal)
+
+    return [('geocode', geocode), ('cluster', cluster), ('route_clusters', route_clusters),
+            ('optimize_route', optimize_route)]
+
+
+def greedy_stages(greedy_cls, codes, start_postal, geocoding, num_routes):
+    gazetteer_only = {key: geocoding[key] for key in ('gazetteer', 'geocode_store')}
+    return [('optimize_route', lambda: greedy_cls(codes, num_groups=num_routes, **gazetteer_only)
+             .optimize_route(start_postal))]
+
+
+def run_variant(variant, stages_fn, codes, start_postal, coordinates, memory):
+    """Time every stage; with memory on, repeat the stages under tracemalloc for peak usage"""
+    stages = {}
+    routes = None
+    for name, stage in stages_fn():
+        routes, seconds, _ = measure(stage, memory=False)
+        stages[name] = {'seconds': round(seconds, 4)}
+    if memory:
+        # A separate pass, since tracing slows the Python-heavy stages down
+        for name, stage in stages_fn():
+            _, _, peak = measure(stage, memory=True)
+            stages[name]['peak_mb'] = round(peak, 2)
+    return {
+        'variant': variant,
+        'stops': len(codes),
+        'stages': stages,
+        'routes': len(routes),
+        'planned_stops': sum(len(route) for route in routes),
+        'tour_km': round(tour_length_km(routes, start_postal, coordinates), 3)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--routes', type=int, default=20)
+    parser.add_argument('--clustering', default='auto')
+    parser.add_argument('--local-search', help="Local search for the current optimizer, e.g. 2opt+oropt")
+    parser.add_argument('--route-workers', type=int, default=1, help="Processes for routing clusters")
+    parser.add_argument('--greedy-max', type=int, default=5000,
+                        help="Largest size for the greedy baseline (pure Python, O(n^2))")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    greedy_cls = load_greedy_optimizer()
+    options = {'num_groups': args.routes, 'clustering': args.clustering, 'local_search': args.local_search,
+               'route_workers': args.route_workers}
+    memory = not args.no_memory
+    results = []
+    print(f"{'stops':>7} {'variant':>8} {'stage':>15} {'seconds':>9} {'peak MB':>8}")
+    for size in args.sizes:
+        codes, coords = synthetic_stops(size, seed=args.seed)
+        coordinates = {code: tuple(point) for code, point in zip(codes, coords)}
+        start_postal = codes[0]
+        with tempfile.TemporaryDirectory() as workdir:
+            geocoding = offline_geocoding(codes, coords, workdir)
+            variants = [('current', lambda: current_stages(codes, start_postal, geocoding, options))]
+            if size <= args.greedy_max:
+                variants.append(('greedy', lambda: greedy_stages(greedy_cls, codes, start_postal,
+                                                                   geocoding, args.routes)))
+            else:
+                results.append({'variant': 'greedy', 'stops': size, 'skipped': f"above --greedy-max {args.greedy_max}"})
+            for variant, stages_fn in variants:
+                result = run_variant(variant, stages_fn, codes, start_postal, coordinates, memory)
+                results.append(result)
+                for stage, values in result['stages'].items():
+                    peak = values.get('peak_mb')
+                    print(f"{size:>7} {variant:>8} {stage:>15} {values['seconds']:>9.3f} "
+                          f"{'' if peak is None else f'{peak:.1f}':>8}")
+                print(f"{size:>7} {variant:>8} {'routes':>15} {result['routes']:>9} "
+                      f"tour {result['tour_km']:.1f} km")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'args': vars(args)
+                },
+                'results': results
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
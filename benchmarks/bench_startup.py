@@ -0,0 +1,126 @@
+"""
+Benchmark cold start: import time of the entry-point modules and the latency
+of the first optimize_route in a fresh interpreter, as a CLI run or a newly
+started worker sees it. Every measurement runs in its own subprocess; the
+first request uses an offline gazetteer, so nothing touches the network.
+
+Also lists which heavy dependencies each import pulls in.
+
+    python benchmarks/bench_startup.py --repeat 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+MODULES = ('postal_route_optimizer', 'route_cli', 'app')
+HEAVY = ('folium', 'sklearn', 'scipy', 'openrouteservice', 'geopy', 'dotenv', 'pandas')
+
+
+def child_import(module):
+    started = time.perf_counter()
+    __import__(module)
+    seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'loaded': [name for name in HEAVY if name in sys.modules]}
+
+
+def child_first_request(stops, routes):
+    import tempfile
+
+    started = time.perf_counter()
+    from postal_route_optimizer import PostalRouteOptimizer
+    imported = time.perf_counter()
+    from synthetic import offline_geocoding, synthetic_stops
+
+    codes, coords = synthetic_stops(stops)
+    with tempfile.TemporaryDirectory() as workdir:
+        geocoding = offline_geocoding(codes, coords, workdir)
+        setup = time.perf_counter()
+        optimizer = PostalRouteOptimizer(codes, num_groups=routes, **geocoding)
+        constructed = time.perf_counter()
+        optimizer.optimize_route(codes[0])
+        first = time.perf_counter()
+        optimizer.optimize_route(codes[0])
+        second = time.perf_counter()
+    return {
+        'import': imported - started,
+        'construct': constructed - setup,
+        'first_optimize': first - constructed,
+        'second_optimize': second - first,
+        # What a fresh process waits for before its first plan, excluding benchmark setup
+        'first_request': (imported - started) + (first - setup),
+        'loaded': [name for name in HEAVY if name in sys.modules]
+    }
+
+
+def run_child(*args):
+    """Run this script as a fresh interpreter and return its JSON result"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', *map(str, args)],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples]
+    return {'median': round(statistics.median(values), 4), 'min': round(min(values), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--stops', type=int, default=200, help="Stops in the first-request scenario")
+    parser.add_argument('--routes', type=int, default=5)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, BENCH_DIR)
+        sys.path.insert(0, REPO_DIR)
+        kind, *params = args.child
+        if kind == 'import':
+            result = child_import(params[0])
+        else:
+            result = child_first_request(int(params[0]), int(params[1]))
+        print(json.dumps(result))
+        return
+
+    results = {'imports': {}, 'first_request': None}
+    print(f"{'measurement':>24} {'median s':>9} {'min s':>9}  heavy modules loaded")
+    for module in args.modules:
+        try:
+            samples = [run_child('import', module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{'import ' + module:>24} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        summary = dict(summarize(samples, 'seconds'), loaded=samples[0]['loaded'])
+        results['imports'][module] = summary
+        print(f"{'import ' + module:>24} {summary['median']:>9.3f} {summary['min']:>9.3f}  "
+              f"{', '.join(summary['loaded']) or '-'}")
+
+    samples = [run_child('first', args.stops, args.routes) for _ in range(args.repeat)]
+    results['first_request'] = {
+        key: summarize(samples, key)
+        for key in ('import', 'construct', 'first_optimize', 'second_optimize', 'first_request')
+    }
+    results['first_request']['loaded'] = samples[0]['loaded']
+    for key, summary in results['first_request'].items():
+        if key != 'loaded':
+            print(f"{key:>24} {summary['median']:>9.3f} {summary['min']:>9.3f}")
+    print(f"{'loaded after optimize':>24} {', '.join(samples[0]['loaded'])}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
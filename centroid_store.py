@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from sqlite_cache import SQLiteDatabase
+
+# Default location of the centroid database (override with CENTROID_STORE_PATH)
+DEFAULT_STORE_PATH = 'centroids.db'
+# Centroids older than this no longer describe the depot's usual stops
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+class CentroidStore(SQLiteDatabase):
+    """
+    Last clustering centroids per (depot, num_groups), so the next plan from the
+    same depot starts from the previous day's clusters: clustering converges in
+    fewer steps and stops keep landing in the same numbered cluster.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS centroids (
+            depot TEXT NOT NULL,
+            num_groups INTEGER NOT NULL,
+            centroids TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (depot, num_groups)
+        )
+        """,
+    )
+
+    def __init__(self, path=None, max_age_days=None):
+        if max_age_days is None:
+            max_age_days = float(os.getenv('CENTROID_MAX_AGE_DAYS', DEFAULT_MAX_AGE_DAYS))
+        self.max_age_seconds = max_age_days * 24 * 3600
+        super().__init__(path or os.getenv('CENTROID_STORE_PATH', DEFAULT_STORE_PATH))
+
+    def get(self, depot, num_groups):
+        """(num_groups, 2) array of (lat, lon) centroids, or None if missing or stale"""
+        row = self._connect().execute(
+            "SELECT centroids FROM centroids WHERE depot = ? AND num_groups = ? AND updated_at > ?",
+            (depot, num_groups, time.time() - self.max_age_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        return np.array(json.loads(row[0]), dtype=np.float64).reshape(-1, 2)
+
+    def put(self, depot, num_groups, centroids):
+        with self.write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO centroids (depot, num_groups, centroids, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (depot, num_groups, json.dumps(np.asarray(centroids, dtype=np.float64).tolist()), time.time())
+            )
+
+
+# One store per process, shared by every optimizer instance
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_centroid_store():
+    """Return the process-wide CentroidStore, creating it on first use"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CentroidStore()
+        return _default_store
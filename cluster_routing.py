@@ -0,0 +1,126 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from distance_matrix import DistanceEngine, RoadMatrix, nearest_neighbour_order
+from local_search import improve_route
+from spatial_index import SpatialIndex, spatial_nearest_neighbour_order
+
+# Clusters with more distinct stops than this are routed on a KD-tree instead of
+# a full distance matrix (unless local search needs the matrix)
+SPATIAL_INDEX_MIN_STOPS = 1000
+# Pools are started from job threads in a multi-threaded server, where fork() can copy a
+# lock held by another thread (logging, sqlite3, HTTP sessions) into a child that never gets it
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def route_cluster(engine, cluster_codes, start_postal, improve=None):
+    """
+    Nearest-neighbour route through one cluster, starting at its code nearest
+    to start_postal. improve(matrix, order) -> order runs local search on the
+    result; without it, large clusters share one spatial index for picking
+    the first stop and for the walk, giving the same tour with no n x n matrix.
+    """
+    distinct = list(dict.fromkeys(cluster_codes))
+    if not distinct:
+        return []
+    embedded = None
+    if improve is None and len(distinct) > SPATIAL_INDEX_MIN_STOPS:
+        # None for road matrices or stops without coordinates
+        embedded = engine.index_points(distinct + [start_postal])
+
+    if embedded is None:
+        cluster_start = distinct[int(np.argmin(engine.matrix([start_postal], distinct)[0]))]
+        stops = [cluster_start] + [code for code in distinct if code != cluster_start]
+        matrix = engine.matrix(stops)
+        order = nearest_neighbour_order(matrix, 0)
+        if improve is not None:
+            order = improve(matrix, order)
+        return [stops[i] for i in order]
+
+    points, p = embedded
+    index = SpatialIndex(points[:-1], p=p)
+    first = index.nearest(points[-1])
+    order = spatial_nearest_neighbour_order(points[:-1], first, p=p, index=index)
+    return [distinct[i] for i in order]
+
+
+def cluster_task(engine, cluster_codes, start_postal):
+    """
+    Compact inputs for routing one cluster in another process.
+    Stops are numbered 0..n-1 in first-seen order with start_postal as n; the
+    task carries only what the metric needs: postal codes as uint32, an (n+1, 2)
+    coordinate array (NaN where unknown) or the (n+1, n+1) road submatrix.
+    """
+    codes = list(dict.fromkeys(cluster_codes)) + [start_postal]
+    if engine.metric == 'postal':
+        if all(str(code).isdigit() and len(str(code)) == 6 for code in codes):
+            return 'postal', np.array([int(code) for code in codes], dtype=np.uint32)
+        return 'postal', np.array(codes)  # Codes that wouldn't survive the round trip to int
+    if engine.metric == 'haversine':
+        return 'haversine', engine._coords(codes)
+    # Road matrices (including ORS) are fetched here so workers never hit the network
+    return 'road', engine.road_matrix.submatrix(codes)
+
+
+def _task_engine(metric, data):
+    """A DistanceEngine over stop numbers, plus those numbers, rebuilt from a cluster_task"""
+    if metric == 'postal':
+        if data.dtype == np.uint32:
+            return DistanceEngine('postal'), [f'{code:06d}' for code in data.tolist()]
+        return DistanceEngine('postal'), data.tolist()
+    stops = list(range(len(data)))
+    if metric == 'haversine':
+        lookup = {i: tuple(point) for i, point in enumerate(data) if not np.isnan(point).any()}
+        return DistanceEngine('haversine', coord_lookup=lookup), stops
+    return DistanceEngine('road', road_matrix=RoadMatrix(stops, data)), [str(i) for i in stops]
+
+
+def run_cluster_task(task, local_search=None, local_search_time=1.0):
+    """
+    Route one cluster_task; module-level so pool workers can run it.
+    Returns (order as stop numbers, local search stats or None).
+    """
+    metric, data = task
+    engine, stops = _task_engine(metric, data)
+    stats = []
+
+    def improve(matrix, order):
+        if callable(local_search):
+            order, result = local_search(matrix, order)
+        else:
+            order, result = improve_route(matrix, order, moves=tuple(local_search.split('+')),
+                                          time_budget=local_search_time)
+        stats.append(result)
+        return order
+
+    # start_postal may also be one of the stops, so it is left out of the numbering
+    number = {stop: i for i, stop in enumerate(stops[:-1])}
+    route = route_cluster(engine, stops[:-1], stops[-1], improve if local_search else None)
+    return np.array([number[stop] for stop in route], dtype=np.int32), (stats[0] if stats else None)
+
+
+def route_clusters_parallel(engine, clusters, start_postal, workers, chunksize=1,
+                            local_search=None, local_search_time=1.0):
+    """
+    Route every cluster across a pool of `workers` processes, `chunksize`
+    clusters per task. start_postal is one code for every cluster or a list
+    with one per cluster. Yields (route, local search stats or None) per
+    cluster in input order, so the plan matches routing them one by one.
+    Workers are started with POOL_START_METHOD rather than fork, so a callable
+    local_search has to be importable by them (a module-level function).
+    """
+    clusters = list(clusters)
+    starts = start_postal if isinstance(start_postal, list) else [start_postal] * len(clusters)
+    distinct = [list(dict.fromkeys(codes)) for codes in clusters]
+    tasks = [cluster_task(engine, codes, start) for codes, start in zip(distinct, starts)]
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+    try:
+        results = executor.map(run_cluster_task, tasks, [local_search] * len(tasks),
+                               [local_search_time] * len(tasks), chunksize=chunksize)
+        for codes, (order, stats) in zip(distinct, results):
+            yield [codes[i] for i in order], stats
+    finally:
+        # A cancelled job stops consuming results; drop the clusters not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,94 @@
+from math import ceil
+
+import numpy as np
+
+# Inputs with at least this many sites use MiniBatchKMeans when clustering='auto'
+MINIBATCH_MIN_POINTS = 20000
+
+
+def _squared_distances(coords, centroids):
+    """(n, k) squared euclidean distance from every point to every centroid"""
+    return ((coords[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+
+
+def capacitated_assignment(distances, weights, capacity):
+    """
+    Assign points to clusters without exceeding capacity (in weight units).
+    Points with the most to lose from not getting their nearest cluster
+    (largest regret between best and second-best choice) are placed first.
+    """
+    n, k = distances.shape
+    preferences = np.argsort(distances, axis=1)
+    if k > 1:
+        sorted_distances = np.take_along_axis(distances, preferences[:, :2], axis=1)
+        regret = sorted_distances[:, 1] - sorted_distances[:, 0]
+    else:
+        regret = np.zeros(n)
+
+    remaining = np.full(k, float(capacity))
+    labels = np.empty(n, dtype=np.intp)
+    for point in np.argsort(-regret, kind='stable'):
+        weight = weights[point]
+        for cluster in preferences[point]:
+            if remaining[cluster] >= weight:
+                break
+        else:
+            # Nothing has room left (only possible with uneven weights): use the emptiest cluster
+            cluster = int(np.argmax(remaining))
+        labels[point] = cluster
+        remaining[cluster] -= weight
+    return labels
+
+
+def minibatch_kmeans(coords, n_clusters, weights=None, init=None, batch_size=4096, random_state=42):
+    """
+    Mini-batch K-means for large inputs: each step updates the centroids from a
+    batch_size sample instead of every point. Returns (labels, centroids).
+    init can be earlier (n_clusters, 2) centroids, e.g. the depot's previous plan,
+    to warm-start from; cluster i then stays near where cluster i was before.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    coords = np.asarray(coords, dtype=np.float64)
+    if init is not None and np.shape(init) != (n_clusters, coords.shape[1]):
+        init = None  # Saved for a different number of clusters
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init='k-means++' if init is None else np.asarray(init, dtype=np.float64),
+        n_init=1,
+        batch_size=batch_size,
+        random_state=random_state
+    )
+    labels = model.fit_predict(coords, sample_weight=weights)
+    return labels, model.cluster_centers_
+
+
+def balanced_kmeans(coords, n_clusters, weights=None, max_iter=20, random_state=42):
+    """
+    K-means with a capacity limit of ceil(total weight / n_clusters) per cluster,
+    so every cluster ends up with a near-equal share of stops (or workload when
+    weights are given). Returns (labels, centroids).
+    """
+    from sklearn.cluster import KMeans
+
+    coords = np.asarray(coords, dtype=np.float64)
+    weights = np.ones(len(coords)) if weights is None else np.asarray(weights, dtype=np.float64)
+    capacity = ceil(weights.sum() / n_clusters)
+
+    # Unconstrained k-means gives good starting centroids
+    centroids = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=1).fit(
+        coords, sample_weight=weights
+    ).cluster_centers_
+
+    labels = None
+    for _ in range(max_iter):
+        new_labels = capacitated_assignment(_squared_distances(coords, centroids), weights, capacity)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        # Move each centroid to the weighted mean of its members
+        for cluster in range(n_clusters):
+            members = labels == cluster
+            if members.any():
+                centroids[cluster] = np.average(coords[members], axis=0, weights=weights[members])
+    return labels, centroids
@@ -0,0 +1,118 @@
+from geocode_store import get_default_store
+from gazetteer import get_default_gazetteer
+from instrumentation import record_cache
+
+
+class CoordinateResolver:
+    """
+    Single coordinate-resolution layer used by every code path
+    (clustering, start-point lookup, map rendering, greedy search).
+    Lookup order:
+    1. In-memory cache for this optimizer
+    2. Offline postal-code gazetteer, if one has been imported
+    3. Persistent geocode store shared across processes
+    4. Network geocoding through geocode_fn
+    Codes that network geocoding couldn't resolve are remembered in `failed` and
+    not retried by this resolver; seed it to share failures between resolvers.
+    """
+
+    def __init__(self, geocode_fn, store=None, cache=None, geocode_many_fn=None, gazetteer=None):
+        # geocode_fn(postal_code) -> {'lat', 'lon', 'source', 'address'} or None
+        self.geocode_fn = geocode_fn
+        # Optional batch variant returning records aligned with its input
+        self.geocode_many_fn = geocode_many_fn
+        self.store = store if store is not None else get_default_store()
+        self.gazetteer = gazetteer if gazetteer is not None else get_default_gazetteer()
+        self.cache = cache if cache is not None else {}
+        self.failed = set()
+        self.batch_size = 50
+        self.stats = {
+            'memory_hits': 0,
+            'gazetteer_hits': 0,
+            'store_hits': 0,
+            'misses': 0,
+            'failures': 0,
+            'known_failures': 0
+        }
+
+    def resolve(self, postal_code):
+        """Return (lat, lon) for one postal code, or None if it can't be geocoded"""
+        return self.resolve_many([postal_code])[0]
+
+    def resolve_many(self, postal_codes, progress=None):
+        """
+        Return a list of (lat, lon) or None, aligned with postal_codes.
+        progress(done, total) is called as network geocoding batches finish.
+        """
+        # Count each distinct code once per call
+        unique_codes = list(dict.fromkeys(postal_codes))
+        missing = []
+        for code in unique_codes:
+            if code in self.cache:
+                self.stats['memory_hits'] += 1
+            elif code in self.failed:
+                self.stats['known_failures'] += 1
+            else:
+                missing.append(code)
+        record_cache('coordinates', len(unique_codes) - len(missing), len(missing))
+
+        # Resolve from the offline gazetteer in one vectorized lookup
+        if missing and self.gazetteer is not None:
+            coords, found = self.gazetteer.lookup_many(missing)
+            record_cache('gazetteer', int(found.sum()), len(missing) - int(found.sum()))
+            still_missing = []
+            for code, (lat, lon), hit in zip(missing, coords, found):
+                if hit:
+                    self.cache[code] = (float(lat), float(lon))
+                    self.stats['gazetteer_hits'] += 1
+                else:
+                    still_missing.append(code)
+            missing = still_missing
+
+        # Fetch everything we can from the persistent store in one query
+        if missing:
+            stored = self.store.get_many(missing)
+            record_cache('geocode_store', len(stored), len(missing) - len(stored))
+            still_missing = []
+            for code in missing:
+                record = stored.get(self.store.normalize(code))
+                if record:
+                    self.cache[code] = (record['lat'], record['lon'])
+                    self.stats['store_hits'] += 1
+                else:
+                    still_missing.append(code)
+            missing = still_missing
+
+        # Anything left has to go over the network
+        if missing:
+            self.stats['misses'] += len(missing)
+            # Geocode in batches so long runs can report progress between them
+            for i in range(0, len(missing), self.batch_size):
+                self._geocode_missing(missing[i:i + self.batch_size])
+                if progress is not None:
+                    progress(min(i + self.batch_size, len(missing)), len(missing))
+
+        return [self.cache.get(code) for code in postal_codes]
+
+    def _geocode_missing(self, postal_codes):
+        """Geocode codes (in one batch when supported) and persist the results"""
+        if self.geocode_many_fn is not None:
+            fetched = self.geocode_many_fn(postal_codes)
+        else:
+            fetched = [self.geocode_fn(code) for code in postal_codes]
+
+        records = []
+        for code, record in zip(postal_codes, fetched):
+            if record:
+                self.cache[code] = (record['lat'], record['lon'])
+                records.append((code, record['lat'], record['lon'], record['source'], record['address']))
+            else:
+                self.failed.add(code)
+                self.stats['failures'] += 1
+        self.store.put_many(records)
+
+    def hit_ratio(self):
+        """Fraction of lookups served without a network call"""
+        hits = self.stats['memory_hits'] + self.stats['gazetteer_hits'] + self.stats['store_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
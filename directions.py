@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_geocoder import TokenBucket
+from instrumentation import map_in_context, record_cache, record_network_call, record_retry
+from ors_matrix import location_key
+from sqlite_cache import SQLiteDatabase
+
+# Default location of the leg geometry cache (override with DIRECTIONS_CACHE_PATH)
+DEFAULT_DIRECTIONS_CACHE_PATH = 'directions.db'
+# Road geometry changes slowly, so legs are kept for 30 days
+DEFAULT_DIRECTIONS_TTL_DAYS = 30
+# Most waypoints the public ORS directions endpoint accepts in one request
+MAX_WAYPOINTS = 50
+
+
+class DirectionsCache(SQLiteDatabase):
+    """On-disk cache of (origin, destination, profile) -> leg geometry, distance (m) and duration (s)"""
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS legs (
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            geometry TEXT NOT NULL,
+            distance REAL,
+            duration REAL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (origin, destination, profile)
+        )
+        """,
+    )
+
+    def __init__(self, path=None, ttl_days=DEFAULT_DIRECTIONS_TTL_DAYS):
+        self.ttl_seconds = ttl_days * 24 * 3600
+        super().__init__(path or os.getenv('DIRECTIONS_CACHE_PATH', DEFAULT_DIRECTIONS_CACHE_PATH))
+
+    def get_many(self, pairs, profile):
+        """Return {(origin, destination): leg} for cached (origin, destination) key pairs"""
+        found = {}
+        now = time.time()
+        conn = self._connect()
+        for origin, destination in dict.fromkeys(pairs):
+            row = conn.execute(
+                "SELECT geometry, distance, duration FROM legs "
+                "WHERE origin = ? AND destination = ? AND profile = ? AND expires_at > ?",
+                (origin, destination, profile, now)
+            ).fetchone()
+            if row is not None:
+                found[(origin, destination)] = {
+                    'geometry': json.loads(row[0]),
+                    'distance': row[1],
+                    'duration': row[2]
+                }
+        return found
+
+    def put_many(self, legs, profile):
+        """Store {(origin, destination): leg} entries"""
+        expires_at = time.time() + self.ttl_seconds
+        rows = [
+            (origin, destination, profile, json.dumps(leg['geometry']),
+             leg['distance'], leg['duration'], expires_at)
+            for (origin, destination), leg in legs.items()
+        ]
+        if not rows:
+            return
+        with self.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO legs "
+                "(origin, destination, profile, geometry, distance, duration, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+
+def split_legs(response):
+    """
+    Split an ORS GeoJSON directions response into one leg per pair of consecutive
+    waypoints: {'geometry': [[lat, lon], ...], 'distance', 'duration'}
+    """
+    feature = response['features'][0]
+    points = [[lat, lon] for lon, lat in feature['geometry']['coordinates']]
+    way_points = feature['properties']['way_points']
+    segments = feature['properties'].get('segments', [])
+    legs = []
+    for i in range(len(way_points) - 1):
+        segment = segments[i] if i < len(segments) else {}
+        legs.append({
+            'geometry': points[way_points[i]:way_points[i + 1] + 1],
+            'distance': segment.get('distance'),
+            'duration': segment.get('duration')
+        })
+    return legs
+
+
+class DirectionsService:
+    """
+    Road geometry for every leg of a route:
+    - legs already in the on-disk cache cost no API call
+    - otherwise the route is requested in multi-waypoint calls of up to
+      max_waypoints stops, skipping chunks whose legs are all cached
+    - if a multi-waypoint call fails (e.g. one stop can't be routed), its
+      missing legs are fetched one by one, concurrently
+    Every request goes through one process-wide rate limiter and is retried
+    only on 429 (rate limited); other failures leave the leg as None so the
+    caller can draw a straight line.
+    """
+
+    def __init__(self, ors_client, profile='driving-car', cache=None, max_waypoints=MAX_WAYPOINTS,
+                 max_workers=4, rate_limit=None, max_retries=3, backoff=2.0):
+        self.ors_client = ors_client
+        self.profile = profile
+        self.cache = cache if cache is not None else get_default_directions_cache()
+        self.max_waypoints = max(2, max_waypoints)
+        self.max_workers = max_workers
+        self.rate_limit = rate_limit if rate_limit is not None else get_directions_rate_limit()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {'cached_legs': 0, 'fetched_legs': 0, 'requests': 0, 'rate_limited': 0, 'failed_legs': 0}
+
+    def _request(self, coordinates):
+        """One directions call for [(lat, lon), ...], retried with backoff only when rate limited"""
+        from openrouteservice.exceptions import ApiError
+
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            self.rate_limit.acquire()
+            self.stats['requests'] += 1
+            started = time.perf_counter()
+            try:
+                response = self.ors_client.directions(
+                    coordinates=[[lon, lat] for lat, lon in coordinates],
+                    profile=self.profile,
+                    format='geojson'
+                )
+                record_network_call('ors_directions', time.perf_counter() - started)
+                return response
+            except ApiError as e:
+                record_network_call('ors_directions', time.perf_counter() - started, ok=False)
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                self.stats['rate_limited'] += 1
+                record_retry('ors_directions')
+                time.sleep(delay)
+                delay *= 2
+
+    def _fetch_chunk(self, coordinates):
+        """Legs for a run of consecutive waypoints, or None if the multi-waypoint call failed"""
+        try:
+            return split_legs(self._request(coordinates))
+        except Exception as e:
+            print(f"Directions for {len(coordinates)} waypoints failed: {str(e)}")
+            return None
+
+    def _fetch_leg(self, origin, destination):
+        try:
+            return split_legs(self._request([origin, destination]))[0]
+        except Exception as e:
+            print(f"Directions for leg {origin} -> {destination} failed: {str(e)}")
+            return None
+
+    def route_legs(self, coordinates, progress=None):
+        """
+        Return one leg per consecutive pair in coordinates [(lat, lon), ...],
+        or None where no road geometry could be fetched.
+        progress(done, total) is called as chunks of legs finish.
+        """
+        coordinates = [(float(lat), float(lon)) for lat, lon in coordinates]
+        keys = [location_key(coords) for coords in coordinates]
+        pairs = list(zip(keys[:-1], keys[1:]))
+        legs = self.cache.get_many(pairs, self.profile)
+        cached = sum(1 for pair in pairs if pair in legs)
+        self.stats['cached_legs'] += cached
+        record_cache('directions', cached, len(pairs) - cached)
+
+        # Consecutive chunks share their boundary waypoint so every leg is covered once
+        step = self.max_waypoints - 1
+        chunks = [
+            range(start, min(start + step, len(pairs)))
+            for start in range(0, len(pairs), step)
+            if any(pairs[i] not in legs for i in range(start, min(start + step, len(pairs))))
+        ]
+        fetched = {}
+        failed_legs = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunk_results = map_in_context(
+                executor, lambda chunk: self._fetch_chunk(coordinates[chunk.start:chunk.stop + 1]), chunks
+            )
+            for done, (chunk, chunk_legs) in enumerate(zip(chunks, chunk_results), 1):
+                if chunk_legs is None or len(chunk_legs) != len(chunk):
+                    failed_legs.extend(i for i in chunk if pairs[i] not in legs)
+                else:
+                    fetched.update((pairs[i], leg) for i, leg in zip(chunk, chunk_legs))
+                if progress is not None:
+                    progress(done, len(chunks))
+
+            # Fall back to single legs so one bad stop doesn't cost the whole chunk
+            failed_legs = list(dict.fromkeys(failed_legs))
+            leg_results = map_in_context(
+                executor, lambda i: self._fetch_leg(coordinates[i], coordinates[i + 1]), failed_legs
+            )
+            for i, leg in zip(failed_legs, leg_results):
+                if leg is not None:
+                    fetched[pairs[i]] = leg
+
+        self.cache.put_many(fetched, self.profile)
+        legs.update(fetched)
+        self.stats['fetched_legs'] += len(fetched)
+        result = [legs.get(pair) for pair in pairs]
+        self.stats['failed_legs'] += sum(1 for leg in result if leg is None)
+        return result
+
+
+_default_directions_cache = None
+_directions_rate_limit = None
+_directions_lock = threading.Lock()
+
+
+def get_default_directions_cache():
+    """Return the process-wide DirectionsCache, creating it on first use"""
+    global _default_directions_cache
+    with _directions_lock:
+        if _default_directions_cache is None:
+            _default_directions_cache = DirectionsCache()
+        return _default_directions_cache
+
+
+def get_directions_rate_limit():
+    """
+    Token bucket shared by every DirectionsService in the process, so concurrent
+    map renders together stay under DIRECTIONS_REQUESTS_PER_MINUTE (default 40)
+    """
+    global _directions_rate_limit
+    with _directions_lock:
+        if _directions_rate_limit is None:
+            per_minute = float(os.getenv('DIRECTIONS_REQUESTS_PER_MINUTE', 40))
+            # Small bursts are fine; the quota is enforced per minute
+            _directions_rate_limit = TokenBucket(per_minute / 60.0, capacity=min(per_minute, 5))
+        return _directions_rate_limit
@@ -0,0 +1,238 @@
+import numpy as np
+
+# Mean Earth radius used for haversine distances
+EARTH_RADIUS_KM = 6371.0088
+
+
+def postal_digits(postal_codes):
+    """
+    Convert postal codes to an (n, width) array of digits, zero-padding short codes
+    to 6 digits. width is 6 unless a code is longer; positions past the end of a
+    shorter code are -1.
+    """
+    padded = [str(code).strip().zfill(6) for code in postal_codes]
+    width = max(map(len, padded), default=6)
+    if not padded:
+        return np.zeros((0, 6), dtype=np.int16)
+    # View each string as width unicode code points ('\0' past its end) and shift '0' to 0
+    points = np.array(padded, dtype=f'U{width}').view(np.uint32).reshape(len(padded), width)
+    digits = points.astype(np.int16) - ord('0')
+    present = points != 0
+    if digits[present].min() < 0 or digits[present].max() > 9:
+        raise ValueError("Postal codes must contain digits only")
+    digits[~present] = -1
+    return digits
+
+
+def _postal_distance(digits_a, digits_b):
+    """
+    Postal-digit heuristic between broadcastable (..., width) digit arrays.
+    Like calculate_distance, digits past the end of the shorter code are ignored.
+    """
+    sector_a = digits_a[..., 0].astype(np.int32) * 10 + digits_a[..., 1]
+    sector_b = digits_b[..., 0].astype(np.int32) * 10 + digits_b[..., 1]
+    distance = np.abs(sector_a - sector_b) * 100
+
+    # One pass per remaining digit keeps peak memory at a single result array
+    for position in range(2, min(digits_a.shape[-1], digits_b.shape[-1])):
+        a, b = digits_a[..., position], digits_b[..., position]
+        if position < 6:
+            distance += np.abs(a - b)
+        else:
+            # Only codes longer than 6 digits reach here; compare them where both have the digit
+            distance += np.where((a >= 0) & (b >= 0), np.abs(a - b), 0)
+    return distance.astype(np.float64)
+
+
+def postal_distance_matrix(codes_a, codes_b=None):
+    """
+    Vectorized version of the postal-digit heuristic in calculate_distance:
+    |sector difference| * 100 + sum of per-digit differences of the last 4 digits
+    """
+    digits_a = postal_digits(codes_a)
+    digits_b = digits_a if codes_b is None else postal_digits(codes_b)
+    return _postal_distance(digits_a[:, None, :], digits_b[None, :, :])
+
+
+def postal_distance_pairs(codes_a, codes_b):
+    """Postal-digit heuristic between codes_a[i] and codes_b[i]"""
+    return _postal_distance(postal_digits(codes_a), postal_digits(codes_b))
+
+
+def postal_points(postal_codes):
+    """
+    Postal codes as (n, 5) points whose L1 distance is exactly the postal-digit
+    heuristic: (sector * 100, digit 3, digit 4, digit 5, digit 6).
+    None if any code is longer than 6 digits, since those have no such embedding.
+    """
+    digits = postal_digits(postal_codes)
+    if digits.shape[1] != 6:
+        return None
+    digits = digits.astype(np.float64)
+    return np.column_stack((digits[:, 0] * 1000 + digits[:, 1] * 100, digits[:, 2:]))
+
+
+def sphere_points(coords):
+    """
+    (lat, lon) rows as 3D unit vectors. Their straight-line distance grows
+    with great-circle distance, so nearest neighbours match haversine's.
+    """
+    lat, lon = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2)).T
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _haversine(coords_a, coords_b):
+    """Great-circle km between broadcastable (..., 2) arrays of (lat, lon) in degrees"""
+    coords_a, coords_b = np.radians(coords_a), np.radians(coords_b)
+    lat_a, lon_a = coords_a[..., 0], coords_a[..., 1]
+    lat_b, lon_b = coords_b[..., 0], coords_b[..., 1]
+    a = (np.sin((lat_b - lat_a) / 2) ** 2
+         + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(coords_a, coords_b=None):
+    """Great-circle distance in km between every pair of (lat, lon) rows"""
+    coords_a = np.asarray(coords_a, dtype=np.float64).reshape(-1, 2)
+    coords_b = coords_a if coords_b is None else np.asarray(coords_b, dtype=np.float64).reshape(-1, 2)
+    return _haversine(coords_a[:, None, :], coords_b[None, :, :])
+
+
+def haversine_pairs(coords_a, coords_b):
+    """Great-circle km between coords_a[i] and coords_b[i]"""
+    return _haversine(
+        np.asarray(coords_a, dtype=np.float64).reshape(-1, 2),
+        np.asarray(coords_b, dtype=np.float64).reshape(-1, 2)
+    )
+
+
+class RoadMatrix:
+    """Imported road distance/duration matrix labelled by postal code"""
+
+    def __init__(self, labels, matrix):
+        self.labels = [str(label) for label in labels]
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        if self.matrix.shape != (len(self.labels), len(self.labels)):
+            raise ValueError("Road matrix must be square and match the number of labels")
+        self.index = {label: i for i, label in enumerate(self.labels)}
+
+    @classmethod
+    def load(cls, path):
+        """Load a matrix saved as .npz with 'labels' and 'matrix' arrays"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['labels'].tolist(), data['matrix'])
+
+    def save(self, path):
+        np.savez_compressed(path, labels=np.array(self.labels), matrix=self.matrix)
+
+    def _indices(self, postal_codes):
+        try:
+            return np.array([self.index[str(code)] for code in postal_codes], dtype=np.intp)
+        except KeyError as e:
+            raise KeyError(f"Postal code {e.args[0]} is not in the road matrix")
+
+    def submatrix(self, codes_a, codes_b=None):
+        rows = self._indices(codes_a)
+        cols = rows if codes_b is None else self._indices(codes_b)
+        return self.matrix[np.ix_(rows, cols)]
+
+
+class DistanceEngine:
+    """
+    Builds one distance matrix per call for a set of postal codes.
+    Metrics:
+    - 'postal': the postal-digit heuristic (no coordinates needed)
+    - 'haversine': great-circle km between cached coordinates
+    - 'road': lookups into an imported RoadMatrix
+    """
+
+    METRICS = ('postal', 'haversine', 'road')
+
+    def __init__(self, metric='postal', coord_lookup=None, road_matrix=None):
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown distance metric '{metric}', expected one of {self.METRICS}")
+        if metric == 'road' and road_matrix is None:
+            raise ValueError("The 'road' metric needs a road_matrix")
+        self.metric = metric
+        # Mapping of postal code -> (lat, lon), e.g. the optimizer's coord_cache
+        self.coord_lookup = coord_lookup if coord_lookup is not None else {}
+        self.road_matrix = road_matrix
+
+    def _coords(self, postal_codes):
+        """Coordinates for postal codes, with NaN rows for codes that couldn't be geocoded"""
+        coords = np.full((len(postal_codes), 2), np.nan)
+        for i, code in enumerate(postal_codes):
+            point = self.coord_lookup.get(code)
+            if point is not None:
+                coords[i] = point
+        return coords
+
+    def matrix(self, codes_a, codes_b=None):
+        """Distance from every code in codes_a to every code in codes_b (or codes_a)"""
+        if self.metric == 'postal':
+            return postal_distance_matrix(codes_a, codes_b)
+        if self.metric == 'road':
+            return self.road_matrix.submatrix(codes_a, codes_b)
+
+        coords_a = self._coords(codes_a)
+        coords_b = None if codes_b is None else self._coords(codes_b)
+        return self._fill_missing(haversine_matrix(coords_a, coords_b))
+
+    def pairs(self, codes_a, codes_b):
+        """Distance from codes_a[i] to codes_b[i] for every i"""
+        if self.metric == 'postal':
+            return postal_distance_pairs(codes_a, codes_b)
+        if self.metric == 'road':
+            # Road providers only expose matrices; look the pairs up in one covering matrix
+            labels = list(dict.fromkeys(list(codes_a) + list(codes_b)))
+            index = {code: i for i, code in enumerate(labels)}
+            matrix = self.road_matrix.submatrix(labels)
+            return matrix[[index[code] for code in codes_a], [index[code] for code in codes_b]]
+        return self._fill_missing(haversine_pairs(self._coords(codes_a), self._coords(codes_b)))
+
+    def index_points(self, postal_codes):
+        """
+        (points, p) such that Minkowski p-distance between points ranks neighbours
+        the same way as this metric, for use with a SpatialIndex.
+        None for road matrices, postal codes longer than 6 digits, or haversine
+        with codes that have no coordinates.
+        """
+        if self.metric == 'postal':
+            points = postal_points(postal_codes)
+            return None if points is None else (points, 1)
+        if self.metric == 'haversine':
+            coords = self._coords(postal_codes)
+            if np.isnan(coords).any():
+                return None
+            return sphere_points(coords), 2
+        return None
+
+    @staticmethod
+    def _fill_missing(distances):
+        """Stops without coordinates go to the back of the queue rather than breaking argmin"""
+        if np.isnan(distances).any():
+            finite = distances[np.isfinite(distances)]
+            distances = np.nan_to_num(distances, nan=(finite.max() if finite.size else 0.0) * 10 + 1e6)
+        return distances
+
+
+def nearest_neighbour_order(matrix, start=0):
+    """
+    Greedy nearest-neighbour tour over a square distance matrix.
+    Each step is a single argmin over the current row with visited stops masked out.
+    Returns row indices in visiting order, beginning with start.
+    """
+    n = len(matrix)
+    if n == 0:
+        return []
+    # Visited stops get an infinite penalty so argmin skips them
+    penalty = np.zeros(n)
+    penalty[start] = np.inf
+
+    order = [start]
+    current = start
+    for _ in range(n - 1):
+        current = int(np.argmin(matrix[current] + penalty))
+        penalty[current] = np.inf
+        order.append(current)
+    return order
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import os
+import threading
+
+import numpy as np
+
+# Default location of the gazetteer arrays (override with GAZETTEER_PATH)
+DEFAULT_GAZETTEER_PATH = 'gazetteer'
+POSTAL_FILE = 'postal_codes.npy'
+COORDS_FILE = 'coords.npy'
+
+
+class Gazetteer:
+    """
+    Offline Singapore postal-code table:
+    - postal_codes.npy: sorted uint32 postal codes
+    - coords.npy: float32 (N, 2) lat/lon rows aligned with postal_codes
+    Both arrays are memory-mapped, so loading is instant and pages are shared
+    between worker processes. Lookups are a vectorized binary search.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.postal_codes = np.load(os.path.join(directory, POSTAL_FILE), mmap_mode='r')
+        self.coords = np.load(os.path.join(directory, COORDS_FILE), mmap_mode='r')
+        if len(self.postal_codes) != len(self.coords):
+            raise ValueError(f"Gazetteer arrays in {directory} have mismatched lengths")
+
+    def __len__(self):
+        return len(self.postal_codes)
+
+    @staticmethod
+    def _to_ints(postal_codes):
+        """
+        Convert postal code strings to ints, using -1 for anything non-numeric or
+        longer than 6 digits (which would overflow, or alias a real code once
+        leading zeros are dropped)
+        """
+        codes = np.char.strip(np.asarray(postal_codes, dtype=str))
+        if not len(codes) or np.char.str_len(codes).max() <= 6:
+            try:
+                # Fast path: every code is numeric
+                return codes.astype(np.int64)
+            except ValueError:
+                pass
+        keys = np.full(len(postal_codes), -1, dtype=np.int64)
+        for i, code in enumerate(codes.tolist()):
+            if len(code) <= 6 and code.isascii() and code.isdigit():
+                keys[i] = int(code)
+        return keys
+
+    def lookup_many(self, postal_codes):
+        """
+        Resolve many codes at once.
+        Returns (coords, found) where coords is a float64 (n, 2) array
+        (NaN for misses) and found is a boolean mask.
+        """
+        keys = self._to_ints(postal_codes)
+        coords = np.full((len(keys), 2), np.nan)
+        if not len(keys) or not len(self.postal_codes):
+            return coords, np.zeros(len(keys), dtype=bool)
+
+        positions = np.searchsorted(self.postal_codes, keys)
+        positions = np.minimum(positions, len(self.postal_codes) - 1)
+        found = (keys >= 0) & (self.postal_codes[positions] == keys)
+        coords[found] = self.coords[positions[found]]
+        return coords, found
+
+    def lookup(self, postal_code):
+        """Return (lat, lon) for one postal code, or None if it's not in the table"""
+        coords, found = self.lookup_many([postal_code])
+        if found[0]:
+            return (float(coords[0, 0]), float(coords[0, 1]))
+        return None
+
+
+def build_gazetteer(rows, directory):
+    """Write (postal_code, lat, lon) rows as sorted gazetteer arrays, keeping the first row per code"""
+    rows = list(rows)
+    postal = np.array([int(str(code).strip()) for code, _, _ in rows], dtype=np.uint32)
+    coords = np.array([(float(lat), float(lon)) for _, lat, lon in rows], dtype=np.float32).reshape(-1, 2)
+
+    # Stable sort so np.unique's first index is the first row seen for each code
+    order = np.argsort(postal, kind='stable')
+    postal, first = np.unique(postal[order], return_index=True)
+    coords = coords[order][first]
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, POSTAL_FILE), postal)
+    np.save(os.path.join(directory, COORDS_FILE), coords)
+    return len(postal)
+
+
+def import_csv(csv_path, directory):
+    """
+    Build a gazetteer from a CSV with postal code, latitude and longitude columns
+    (accepts POSTAL/LATITUDE/LONGITUDE as in OneMap exports, or postal_code/lat/lon)
+    """
+    aliases = {
+        'postal': ('postal', 'postal_code', 'postcode'),
+        'lat': ('latitude', 'lat'),
+        'lon': ('longitude', 'lon', 'lng')
+    }
+    with open(csv_path, newline='') as file:
+        reader = csv.DictReader(file)
+        columns = {name.lower().strip(): name for name in reader.fieldnames or []}
+        picked = {}
+        for key, options in aliases.items():
+            match = next((columns[option] for option in options if option in columns), None)
+            if match is None:
+                raise ValueError(f"{csv_path} has no column for {key} (expected one of {options})")
+            picked[key] = match
+
+        rows = [
+            (row[picked['postal']], row[picked['lat']], row[picked['lon']])
+            for row in reader
+            if row[picked['postal']].strip().isdigit()
+        ]
+    return build_gazetteer(rows, directory)
+
+
+_default_gazetteer = None
+_default_gazetteer_loaded = False
+_default_gazetteer_lock = threading.Lock()
+
+
+def get_default_gazetteer():
+    """Return the process-wide Gazetteer, or None if no gazetteer has been imported"""
+    global _default_gazetteer, _default_gazetteer_loaded
+    with _default_gazetteer_lock:
+        if not _default_gazetteer_loaded:
+            directory = os.getenv('GAZETTEER_PATH', DEFAULT_GAZETTEER_PATH)
+            if os.path.exists(os.path.join(directory, POSTAL_FILE)):
+                _default_gazetteer = Gazetteer(directory)
+            _default_gazetteer_loaded = True
+        return _default_gazetteer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a postal-code CSV into the offline gazetteer")
+    parser.add_argument('csv_path', help="CSV with postal code, latitude and longitude columns")
+    parser.add_argument('--out', default=os.getenv('GAZETTEER_PATH', DEFAULT_GAZETTEER_PATH),
+                        help="Directory to write the gazetteer arrays to")
+    args = parser.parse_args()
+    count = import_csv(args.csv_path, args.out)
+    print(f"Imported {count} postal codes into {args.out}")
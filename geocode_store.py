@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+from sqlite_cache import SQLiteDatabase
+
+# Default location of the shared geocode database (override with GEOCODE_STORE_PATH)
+DEFAULT_STORE_PATH = 'geocode_cache.db'
+# Geocodes rarely change, so keep them for 90 days unless told otherwise
+DEFAULT_TTL_DAYS = 90
+
+
+class GeocodeStore(SQLiteDatabase):
+    """
+    Persistent geocode cache keyed by 6-digit postal code.
+    Backed by SQLite in WAL mode so many Flask worker processes can read
+    at the same time while writes are serialized through a single writer lock.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS geocodes (
+            postal_code TEXT PRIMARY KEY,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            source TEXT NOT NULL,
+            address TEXT,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+    )
+
+    def __init__(self, path=None, ttl_days=None):
+        if ttl_days is None:
+            ttl_days = float(os.getenv('GEOCODE_TTL_DAYS', DEFAULT_TTL_DAYS))
+        self.ttl_seconds = ttl_days * 24 * 3600
+        super().__init__(path or os.getenv('GEOCODE_STORE_PATH', DEFAULT_STORE_PATH))
+
+    @staticmethod
+    def normalize(postal_code):
+        """Postal codes are stored as zero-padded 6-digit strings"""
+        return str(postal_code).strip().zfill(6)
+
+    def get(self, postal_code):
+        """Return the cached record for a postal code, or None if missing/expired"""
+        return self.get_many([postal_code]).get(self.normalize(postal_code))
+
+    def get_many(self, postal_codes):
+        """Look up many postal codes at once, returning {postal_code: record} for fresh hits"""
+        keys = list(dict.fromkeys(self.normalize(code) for code in postal_codes))
+        found = {}
+        now = time.time()
+        conn = self._connect()
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f"SELECT postal_code, lat, lon, source, address FROM geocodes "
+                f"WHERE postal_code IN ({placeholders}) AND expires_at > ?",
+                (*chunk, now)
+            )
+            for code, lat, lon, source, address in rows:
+                found[code] = {
+                    'lat': lat,
+                    'lon': lon,
+                    'source': source,
+                    'address': address
+                }
+        return found
+
+    def put(self, postal_code, lat, lon, source, address=None):
+        """Store a single geocode result"""
+        self.put_many([(postal_code, lat, lon, source, address)])
+
+    def put_many(self, records):
+        """Store (postal_code, lat, lon, source, address) tuples in one write transaction"""
+        now = time.time()
+        rows = [
+            (self.normalize(code), float(lat), float(lon), source, address, now, now + self.ttl_seconds)
+            for code, lat, lon, source, address in records
+        ]
+        if not rows:
+            return
+        with self.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO geocodes "
+                "(postal_code, lat, lon, source, address, fetched_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def purge_expired(self):
+        """Delete expired entries, returning how many were removed"""
+        conn = self._connect()
+        cursor = conn.execute("DELETE FROM geocodes WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+
+
+# One store per process, shared by every optimizer instance
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Return the process-wide GeocodeStore, creating it on first use"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = GeocodeStore()
+        return _default_store
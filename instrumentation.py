@@ -0,0 +1,226 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for network latency and stage duration histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.01, 0.05, 0.25, 1.0, 5.0, 15.0, 60.0, 300.0)
+
+METRIC_HELP = {
+    'route_stage_seconds': ('histogram', "Time spent per optimize stage"),
+    'route_network_requests_total': ('counter', "Network requests per provider and outcome"),
+    'route_network_latency_seconds': ('histogram', "Network request latency per provider"),
+    'route_network_retries_total': ('counter', "Retries after rate limiting, per provider"),
+    'route_cache_hits_total': ('counter', "Cache hits per cache layer"),
+    'route_cache_misses_total': ('counter', "Cache misses per cache layer")
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(upper bound label, cumulative count), ...] ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'buckets': dict(self.cumulative())
+        }
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms for the whole process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            names = sorted({name for name, _ in self.counters} | {name for name, _ in self.histograms})
+            for name in names:
+                kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_label_text(labels)} {value}')
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{_label_text(labels, [("le", bound)])} {count}')
+                    lines.append(f'{name}_sum{_label_text(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{_label_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RunMetrics:
+    """Instrumentation for one optimize run (or one map request)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.network = {}  # provider -> {'calls', 'errors', 'latency'}
+        self.retries = {}
+        self.caches = {}   # layer -> {'hits', 'misses'}
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_call(self, provider, seconds, ok):
+        with self.lock:
+            entry = self.network.setdefault(
+                provider, {'calls': 0, 'errors': 0, 'latency': Histogram(LATENCY_BUCKETS)}
+            )
+            entry['calls'] += 1
+            entry['errors'] += 0 if ok else 1
+            entry['latency'].observe(seconds)
+
+    def add_retry(self, provider):
+        with self.lock:
+            self.retries[provider] = self.retries.get(provider, 0) + 1
+
+    def add_cache(self, layer, hits, misses):
+        with self.lock:
+            entry = self.caches.setdefault(layer, {'hits': 0, 'misses': 0})
+            entry['hits'] += hits
+            entry['misses'] += misses
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                'network': {
+                    provider: {
+                        'calls': entry['calls'],
+                        'errors': entry['errors'],
+                        'latency': entry['latency'].to_dict()
+                    }
+                    for provider, entry in self.network.items()
+                },
+                'retries': dict(self.retries),
+                'caches': {
+                    layer: dict(entry, hit_ratio=round(entry['hits'] / max(1, entry['hits'] + entry['misses']), 4))
+                    for layer, entry in self.caches.items()
+                }
+            }
+
+
+# Every report goes to REGISTRY (served on /metrics) and, when an optimize run
+# is being instrumented in the current context, to that run's RunMetrics too
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+
+@contextmanager
+def instrument_run():
+    """Collect RunMetrics for everything reported in this context"""
+    run = RunMetrics()
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def map_in_context(executor, fn, *iterables):
+    """
+    executor.map that runs each call in a copy of the caller's context,
+    so work on pool threads still reports to the caller's run
+    """
+    argument_lists = [list(iterable) for iterable in iterables]
+    contexts = [contextvars.copy_context() for _ in argument_lists[0]] if argument_lists else []
+    return executor.map(lambda context, *args: context.run(fn, *args), contexts, *argument_lists)
+
+
+@contextmanager
+def timed_stage(name):
+    """Time a pipeline stage (geocode, cluster, route, render)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        REGISTRY.observe('route_stage_seconds', seconds, buckets=STAGE_BUCKETS, stage=name)
+        run = _current_run.get()
+        if run is not None:
+            run.add_stage(name, seconds)
+
+
+def record_network_call(provider, seconds, ok=True):
+    REGISTRY.inc('route_network_requests_total', provider=provider, outcome='ok' if ok else 'error')
+    REGISTRY.observe('route_network_latency_seconds', seconds, provider=provider)
+    run = _current_run.get()
+    if run is not None:
+        run.add_call(provider, seconds, ok)
+
+
+def record_retry(provider):
+    REGISTRY.inc('route_network_retries_total', provider=provider)
+    run = _current_run.get()
+    if run is not None:
+        run.add_retry(provider)
+
+
+def record_cache(layer, hits, misses):
+    if hits:
+        REGISTRY.inc('route_cache_hits_total', hits, layer=layer)
+    if misses:
+        REGISTRY.inc('route_cache_misses_total', misses, layer=layer)
+    run = _current_run.get()
+    if run is not None and (hits or misses):
+        run.add_cache(layer, hits, misses)
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Share of overall progress given to each phase of an optimize run
+PHASES = OrderedDict([
+    ('queued', (0.0, 0.0)),
+    ('geocoding', (0.0, 0.4)),
+    ('clustering', (0.4, 0.5)),
+    ('routing', (0.5, 0.9)),
+    ('rendering', (0.9, 1.0))
+])
+# Finished jobs are forgotten this long after they end (override with JOB_TTL_SECONDS)
+DEFAULT_JOB_TTL_SECONDS = 3600
+# Progress within a phase is written to a shared job store at most this often
+PUBLISH_INTERVAL_SECONDS = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's worker thread once the job has been cancelled"""
+
+
+class Job:
+    """
+    A background optimize run with its phase, progress and result. The result
+    should be a small summary (e.g. the session id the plan was stored under),
+    not the plan itself, since finished jobs are kept for status polling.
+    """
+
+    def __init__(self, on_update=None):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'  # queued, running, done, failed, cancelled
+        self.phase = 'queued'
+        self.percent = 0.0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        # on_update(job) is told about progress, e.g. to publish it to other processes
+        self._on_update = on_update
+
+    def report(self, phase, fraction=0.0):
+        """
+        Progress callback for the optimizer: fraction is progress within phase.
+        Raises JobCancelled so a cancelled run stops at its next checkpoint.
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+        start, end = PHASES.get(phase, (self.percent / 100, self.percent / 100))
+        self.phase = phase
+        self.percent = round(100 * (start + (end - start) * min(max(fraction, 0.0), 1.0)), 1)
+        if self._on_update is not None:
+            self._on_update(self)
+
+    def cancel(self):
+        self._cancel.set()
+        if self.status == 'queued':
+            self.status = 'cancelled'
+            self.finished_at = time.time()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'phase': self.phase,
+            'percent': self.percent,
+            'elapsed': round(self.elapsed(), 2),
+            'error': self.error
+        }
+
+
+class JobManager:
+    """
+    Runs optimize jobs on a thread pool.
+    max_workers caps how many jobs run at once; further jobs wait in the queue.
+    Finished jobs are kept for status polling for ttl_seconds, and only the
+    newest max_jobs of them.
+    With a shared store (session_store.SQLiteJobStore) every state change is
+    published there, so status() and cancel() work from any worker process.
+    """
+
+    def __init__(self, max_workers=None, max_jobs=200, ttl_seconds=None, store=None):
+        if max_workers is None:
+            max_workers = int(os.getenv('MAX_CONCURRENT_JOBS', 2))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('JOB_TTL_SECONDS', DEFAULT_JOB_TTL_SECONDS))
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._published = {}  # job_id -> (phase, time) of its last write to the store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='optimize-job')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result"""
+        job = Job(on_update=self._publish)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._publish(job, force=True)
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if self.store is not None and self.store.cancel_requested(job.id):
+            job.cancel()  # Cancelled through another worker while queued
+        if job.cancelled:
+            self._publish(job, force=True)
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        self._publish(job, force=True)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = 'done'
+            job.phase = 'done'
+            job.percent = 100.0
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._publish(job, force=True)
+
+    @staticmethod
+    def state(job):
+        """The job's status fields, plus its result summary once it is done"""
+        state = job.to_dict()
+        if job.status == 'done' and job.result:
+            state.update(job.result)
+        return state
+
+    def _publish(self, job, force=False):
+        """
+        Write the job's state to the shared store: always when forced or the phase
+        changed, otherwise at most every PUBLISH_INTERVAL_SECONDS. Also picks up
+        a cancel requested through another process.
+        """
+        if self.store is None:
+            return
+        now = time.time()
+        phase, published_at = self._published.get(job.id, (None, 0.0))
+        if not force and phase == job.phase and now - published_at < PUBLISH_INTERVAL_SECONDS:
+            return
+        if job.finished_at is None:
+            self._published[job.id] = (job.phase, now)
+        else:
+            self._published.pop(job.id, None)
+        self.store.put(job.id, self.state(job))
+        if job.status in ('queued', 'running') and self.store.cancel_requested(job.id):
+            job.cancel()
+
+    def _prune(self):
+        """Forget finished jobs older than ttl_seconds, then the oldest beyond max_jobs"""
+        expired = time.time() - self.ttl_seconds
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.status in ('done', 'failed', 'cancelled') and job.finished_at is not None]
+        for job_id in finished:
+            if self.jobs[job_id].finished_at <= expired:
+                del self.jobs[job_id]
+        finished = [job_id for job_id in finished if job_id in self.jobs]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        """The Job object, if it was submitted to this process and is still kept"""
+        with self.lock:
+            self._prune()
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        """The job's state dict from this process or the shared store, or None if unknown"""
+        job = self.get(job_id)
+        if job is not None:
+            return self.state(job)
+        if self.store is not None:
+            return self.store.get(job_id)
+        return None
+
+    def cancel(self, job_id):
+        """Cancel a job run by this or (through the store) another process; returns its state"""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+            self._publish(job, force=True)
+            return self.state(job)
+        if self.store is not None:
+            return self.store.request_cancel(job_id)
+        return None
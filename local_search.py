@@ -0,0 +1,240 @@
+import time
+from collections import deque
+
+import numpy as np
+
+# Moves must improve the tour by more than this to be applied (guards against float noise)
+EPSILON = 1e-9
+# Supported improvement moves
+MOVES = ('2opt', 'oropt')
+
+
+def tour_length(matrix, order):
+    """Length of an open path visiting matrix indices in order"""
+    order = np.asarray(order, dtype=np.intp)
+    if len(order) < 2:
+        return 0.0
+    return float(matrix[order[:-1], order[1:]].sum())
+
+
+def neighbour_lists(matrix, k):
+    """The k nearest other stops for every stop, sorted by distance"""
+    n = len(matrix)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.zeros((n, 0), dtype=np.intp)
+    masked = np.array(matrix, dtype=np.float64)
+    np.fill_diagonal(masked, np.inf)
+    nearest = np.argpartition(masked, k - 1, axis=1)[:, :k]
+    distances = np.take_along_axis(masked, nearest, axis=1)
+    return np.take_along_axis(nearest, np.argsort(distances, axis=1), axis=1)
+
+
+class LocalSearch:
+    """
+    2-opt and Or-opt improvement of an open path with a fixed first stop.
+    - Candidate moves come from each stop's k nearest neighbours, so a pass is
+      O(n * k) rather than O(n^2)
+    - Don't-look bits: only stops next to a recent change are re-examined
+    - Stops after time_budget seconds, keeping the best tour found so far
+    The path is stored with a zero-cost sentinel at the end so the last stop can move freely.
+    Asymmetric matrices (e.g. ORS durations) are supported: moves that reverse a
+    segment also count the change in that segment's own length.
+    """
+
+    def __init__(self, matrix, moves=('2opt', 'oropt'), neighbours=10, time_budget=1.0,
+                 max_segment=3):
+        unknown = set(moves) - set(MOVES)
+        if unknown:
+            raise ValueError(f"Unknown local search moves {sorted(unknown)}, expected any of {MOVES}")
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.moves = moves
+        self.neighbours = neighbours
+        self.time_budget = time_budget
+        self.max_segment = max_segment
+
+    def improve(self, order, focus=None):
+        """
+        Improve a path given as matrix indices, returning (order, stats).
+        focus optionally lists positions in order to examine first; only
+        those stops start with their don't-look bit off (e.g. just the
+        stops around an insertion).
+        """
+        started = time.perf_counter()
+        order = [int(i) for i in order]
+        n = len(order)
+        initial = tour_length(self.matrix, order)
+        stats = {
+            'stops': n,
+            'initial_length': initial,
+            'final_length': initial,
+            'two_opt_moves': 0,
+            'or_opt_moves': 0,
+            'elapsed': 0.0,
+            'timed_out': False
+        }
+        if n < 4:
+            stats['elapsed'] = time.perf_counter() - started
+            return order, stats
+
+        # Work on a compact matrix over just these stops plus the sentinel
+        sub = np.zeros((n + 1, n + 1))
+        sub[:n, :n] = self.matrix[np.ix_(order, order)]
+        self._sub = sub
+        self._dist = sub.item
+        self._near = neighbour_lists(sub[:n, :n], self.neighbours).tolist()
+        self._tour = np.arange(n + 1)
+        self._pos = np.arange(n + 1)
+        self._last = n - 1  # last movable position; position n holds the sentinel
+        self._symmetric = np.allclose(sub, sub.T)
+        self._update_prefixes()
+
+        deadline = started + self.time_budget if self.time_budget else None
+        # Don't-look bits: a stop is (re)queued only when an adjacent edge changes
+        queue = deque(range(n) if focus is None else dict.fromkeys(int(i) for i in focus))
+        active = [False] * n
+        for node in queue:
+            active[node] = True
+        while queue:
+            if deadline is not None and time.perf_counter() > deadline:
+                stats['timed_out'] = True
+                break
+            node = queue.popleft()
+            active[node] = False
+            touched = None
+            if '2opt' in self.moves:
+                touched = self._try_two_opt(node)
+                if touched:
+                    stats['two_opt_moves'] += 1
+            if not touched and 'oropt' in self.moves:
+                touched = self._try_or_opt(node)
+                if touched:
+                    stats['or_opt_moves'] += 1
+            if touched:
+                for other in touched + [node]:
+                    if other < n and not active[other]:
+                        active[other] = True
+                        queue.append(other)
+
+        local_order = self._tour[:n]
+        improved = [order[i] for i in local_order]
+        final = tour_length(self.matrix, improved)
+        # Never hand back a longer tour than the one we were given
+        if final < initial:
+            order = improved
+            stats['final_length'] = final
+        stats['elapsed'] = time.perf_counter() - started
+        return order, stats
+
+    def _update_prefixes(self):
+        """
+        Prefix sums of every tour edge walked forwards and backwards, so the change
+        in a segment's own length when reversed is O(1) on asymmetric matrices
+        """
+        if self._symmetric:
+            return
+        t, sub = self._tour, self._sub
+        self._forward = np.concatenate(([0.0], np.cumsum(sub[t[:-1], t[1:]])))
+        self._backward = np.concatenate(([0.0], np.cumsum(sub[t[1:], t[:-1]])))
+
+    def _reversal_delta(self, start, end):
+        """Change in the length of tour[start..end] itself when walked in reverse"""
+        if self._symmetric:
+            return 0.0
+        return (self._backward[end] - self._backward[start]) - (self._forward[end] - self._forward[start])
+
+    def _two_opt_delta(self, x, y):
+        """Gain of reversing tour[x+1..y] (negative means shorter)"""
+        t, d = self._tour, self._dist
+        a, b, c, e = t[x], t[x + 1], t[y], t[y + 1]
+        return d(a, c) + d(b, e) - d(a, b) - d(c, e) + self._reversal_delta(x + 1, y)
+
+    def _try_two_opt(self, node):
+        """Look for an improving 2-opt move that adds an edge between node and a near neighbour"""
+        t, pos, d = self._tour, self._pos, self._dist
+        i = pos[node]
+        succ = t[i + 1]
+        pred = t[i - 1] if i > 0 else None
+        for other in self._near[node]:
+            j = pos[other]
+            gain_succ = d(node, other) < d(node, succ)
+            gain_pred = pred is not None and d(node, other) < d(pred, node)
+            # Neighbours are sorted, so no later one can beat either existing edge
+            if not gain_succ and not gain_pred:
+                break
+            candidates = []
+            # New edge (node, other) replacing (node, succ)
+            if gain_succ:
+                candidates.append((i, j) if j > i else (j, i))
+            # New edge (node, other) replacing (pred, node)
+            if gain_pred and j > 0:
+                candidates.append((i - 1, j - 1) if j > i else (j - 1, i - 1))
+            for x, y in candidates:
+                if 0 <= x < y <= self._last and self._two_opt_delta(x, y) < -EPSILON:
+                    touched = [int(t[x]), int(t[x + 1]), int(t[y]), int(t[y + 1])]
+                    self._reverse(x + 1, y)
+                    return touched
+        return None
+
+    def _reverse(self, start, end):
+        """Reverse tour[start..end] in place and fix up positions"""
+        t = self._tour
+        t[start:end + 1] = t[start:end + 1][::-1].copy()
+        self._pos[t[start:end + 1]] = np.arange(start, end + 1)
+        self._update_prefixes()
+
+    def _try_or_opt(self, node):
+        """Move a segment of 1..max_segment stops starting at node next to a near neighbour"""
+        t, pos, d = self._tour, self._pos, self._dist
+        i = pos[node]
+        if i == 0:
+            return None
+        for length in range(1, self.max_segment + 1):
+            end = i + length - 1
+            if end > self._last:
+                break
+            first, last = t[i], t[end]
+            prev, nxt = t[i - 1], t[end + 1]
+            removal_gain = d(prev, first) + d(last, nxt) - d(prev, nxt)
+            if removal_gain <= EPSILON:
+                continue
+            # Extra length of the segment itself when it is reinserted reversed
+            reversal = self._reversal_delta(i, end)
+            for anchor in self._near[first] + self._near[last]:
+                k = pos[anchor]
+                if i <= k <= end:
+                    continue
+                # Insert between (anchor, its successor) and (its predecessor, anchor)
+                for left, right in ((k, k + 1), (k - 1, k)):
+                    if left < 0 or right > self._last + 1 or i <= right <= end or i <= left <= end:
+                        continue
+                    a, b = t[left], t[right]
+                    base = d(a, b)
+                    forward = d(a, first) + d(last, b) - base
+                    backward = d(a, last) + d(first, b) - base + reversal
+                    cost = min(forward, backward)
+                    if cost < removal_gain - EPSILON:
+                        segment = t[i:end + 1].copy()
+                        if backward < forward:
+                            segment = segment[::-1]
+                        touched = [int(prev), int(nxt), int(a), int(b), int(first), int(last)]
+                        self._move_segment(i, end, right, segment)
+                        return touched
+        return None
+
+    def _move_segment(self, start, end, insert_before, segment):
+        """Remove tour[start..end] and reinsert segment before the stop at position insert_before"""
+        t = self._tour
+        target = t[insert_before]
+        rest = np.concatenate((t[:start], t[end + 1:]))
+        split = int(np.nonzero(rest == target)[0][0])
+        self._tour = np.concatenate((rest[:split], segment, rest[split:]))
+        self._pos[self._tour] = np.arange(len(self._tour))
+        self._update_prefixes()
+
+
+def improve_route(matrix, order, moves=('2opt', 'oropt'), neighbours=10, time_budget=1.0, focus=None):
+    """Run the local-search improvement stage on one route, returning (order, stats)"""
+    return LocalSearch(matrix, moves=moves, neighbours=neighbours, time_budget=time_budget).improve(
+        order, focus=focus
+    )
@@ -0,0 +1,154 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from instrumentation import record_cache
+
+# Bump when the rendered map layout changes so old files stop being served
+MAP_FORMAT_VERSION = 1
+DEFAULT_STATIC_DIR = 'static'
+DEFAULT_MAX_MB = 200
+DEFAULT_MAX_AGE_HOURS = 7 * 24
+
+
+def map_key(start_postal, route, options=None):
+    """Content address for a rendered map: hash of start point, stop order and render options"""
+    payload = json.dumps(
+        [MAP_FORMAT_VERSION, start_postal, list(route), options or {}],
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class MapCache:
+    """
+    Rendered route maps stored as static/maps/<hash>.html.
+    Identical (start, route, options) requests are served from the existing file.
+    After every new file the directory is trimmed: files older than max_age_hours
+    go first, then the least recently used until it fits in max_mb.
+    A file's mtime doubles as its last-used time, so eviction works the same
+    for every worker process sharing the directory.
+    Degraded maps (some legs drawn as straight lines because directions failed)
+    are saved under a key that lookups never use, so they are served once and the
+    next request tries the directions again.
+    """
+
+    def __init__(self, static_dir=None, max_mb=None, max_age_hours=None):
+        self.static_dir = static_dir or os.getenv('MAP_CACHE_STATIC_DIR', DEFAULT_STATIC_DIR)
+        self.directory = os.path.join(self.static_dir, 'maps')
+        if max_mb is None:
+            max_mb = float(os.getenv('MAP_CACHE_MAX_MB', DEFAULT_MAX_MB))
+        if max_age_hours is None:
+            max_age_hours = float(os.getenv('MAP_CACHE_MAX_AGE_HOURS', DEFAULT_MAX_AGE_HOURS))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_hours * 3600
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'render_failures': 0, 'degraded': 0, 'evictions': 0}
+
+    def get_or_render(self, start_postal, route, render, options=None):
+        """
+        Return the map's filename relative to the static directory, rendering it with
+        render() -> (folium.Map or None, complete) only on a miss. Returns None if
+        rendering failed.
+        """
+        key = map_key(start_postal, route, options)
+        path = os.path.join(self.directory, f'{key}.html')
+        filename = f'maps/{key}.html'
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Mark as recently used
+                with self.lock:
+                    self.stats['hits'] += 1
+                record_cache('map_html', 1, 0)
+                return filename
+            except FileNotFoundError:
+                pass  # Evicted by another worker in the meantime
+
+        with self.lock:
+            self.stats['misses'] += 1
+        record_cache('map_html', 0, 1)
+        route_map, complete = render()
+        if route_map is None:
+            with self.lock:
+                self.stats['render_failures'] += 1
+            return None
+        if not complete:
+            with self.lock:
+                self.stats['degraded'] += 1
+            key = map_key(start_postal, route, dict(options or {}, degraded=True))
+            path = os.path.join(self.directory, f'{key}.html')
+            filename = f'maps/{key}.html'
+
+        # Write to a temporary file and rename so readers never see a partial map
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        try:
+            route_map.save(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=path)
+        return filename
+
+    def _files(self):
+        """(mtime, size, path) for every cached map, oldest first"""
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.html')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def evict(self, keep=None):
+        """Remove expired maps, then the least recently used ones until under max_bytes"""
+        cutoff = time.time() - self.max_age_seconds
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if path == keep or (mtime >= cutoff and total <= self.max_bytes):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self.lock:
+            self.stats['evictions'] += removed
+        return removed
+
+    def remove_legacy_maps(self):
+        """Delete tmp*.html maps that older versions wrote straight into the static directory"""
+        removed = 0
+        for path in glob.glob(os.path.join(self.static_dir, 'tmp*.html')):
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def summary(self):
+        """Counters plus current size of the cache directory"""
+        files = self._files()
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'hit_ratio': stats['hits'] / lookups if lookups else 0.0,
+            'files': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'max_bytes': self.max_bytes,
+            'max_age_seconds': self.max_age_seconds
+        })
+        return stats
@@ -0,0 +1,77 @@
+def _encode_value(value):
+    """One signed integer in the encoded polyline format"""
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(points, precision=5):
+    """
+    Encode [(lat, lon), ...] in Google's encoded polyline format:
+    each point is stored as a delta from the previous one, ~4 bytes per point
+    instead of ~40 for a JSON coordinate pair.
+    """
+    factor = 10 ** precision
+    encoded = []
+    previous_lat = previous_lon = 0
+    for lat, lon in points:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        encoded.append(_encode_value(lat - previous_lat))
+        encoded.append(_encode_value(lon - previous_lon))
+        previous_lat, previous_lon = lat, lon
+    return ''.join(encoded)
+
+
+def encoded_route(stops, legs):
+    """
+    Compact map payload for one route, for drawing on a client-side Leaflet map.
+    stops is [(postal, (lat, lon)), ...] starting with the start point; legs is
+    aligned with consecutive stops, each a directions leg or None (straight line).
+    """
+    markers = [
+        {'postal': postal, 'lat': round(lat, 6), 'lon': round(lon, 6), 'start': i == 0}
+        for i, (postal, (lat, lon)) in enumerate(stops)
+    ]
+    polylines = []
+    for i, leg in enumerate(legs):
+        if leg is not None:
+            polylines.append({'polyline': encode_polyline(leg['geometry']), 'road': True})
+        else:
+            polylines.append({'polyline': encode_polyline([stops[i][1], stops[i + 1][1]]), 'road': False})
+    lats = [marker['lat'] for marker in markers]
+    lons = [marker['lon'] for marker in markers]
+    return {
+        'markers': markers,
+        'legs': polylines,
+        'bounds': [[min(lats), min(lons)], [max(lats), max(lons)]] if markers else None
+    }
+
+
+def route_geojson(stops, legs):
+    """The same route as a GeoJSON FeatureCollection (stop points and leg lines), for GIS tools"""
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'postal': postal, 'sequence': i, 'start': i == 0}
+        }
+        for i, (postal, (lat, lon)) in enumerate(stops)
+    ]
+    for i, leg in enumerate(legs):
+        points = leg['geometry'] if leg is not None else [stops[i][1], stops[i + 1][1]]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in points]},
+            'properties': {
+                'from': stops[i][0],
+                'to': stops[i + 1][0],
+                'road': leg is not None,
+                'distance': leg['distance'] if leg is not None else None,
+                'duration': leg['duration'] if leg is not None else None
+            }
+        })
+    return {'type': 'FeatureCollection', 'features': features}
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from batch_geocoder import TokenBucket
+from instrumentation import record_cache, record_network_call, record_retry
+from sqlite_cache import SQLiteDatabase
+
+# Default location of the travel matrix cache (override with TRAVEL_MATRIX_CACHE_PATH)
+DEFAULT_MATRIX_CACHE_PATH = 'travel_matrix.db'
+# Road travel times barely change, so entries are kept for 30 days
+DEFAULT_MATRIX_TTL_DAYS = 30
+# Cost used for pairs ORS can't route between, so they are visited last
+UNREACHABLE = 1e9
+
+
+def location_key(coords):
+    """Cache key for a (lat, lon) point, rounded to ~10 cm"""
+    return f"{coords[0]:.6f},{coords[1]:.6f}"
+
+
+class TravelMatrixCache(SQLiteDatabase):
+    """On-disk cache of (origin, destination, profile) -> duration (s), distance (m)"""
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS travel_matrix (
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            duration REAL,
+            distance REAL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (origin, destination, profile)
+        )
+        """,
+    )
+
+    def __init__(self, path=None, ttl_days=DEFAULT_MATRIX_TTL_DAYS):
+        self.ttl_seconds = ttl_days * 24 * 3600
+        super().__init__(path or os.getenv('TRAVEL_MATRIX_CACHE_PATH', DEFAULT_MATRIX_CACHE_PATH))
+
+    def get_many(self, origins, destinations, profile):
+        """Return {(origin, destination): (duration, distance)} for cached pairs"""
+        found = {}
+        now = time.time()
+        conn = self._connect()
+        origins = list(dict.fromkeys(origins))
+        destinations = set(destinations)
+        # Query per origin chunk; destinations are filtered in Python to stay under parameter limits
+        for i in range(0, len(origins), 500):
+            chunk = origins[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f"SELECT origin, destination, duration, distance FROM travel_matrix "
+                f"WHERE profile = ? AND origin IN ({placeholders}) AND expires_at > ?",
+                (profile, *chunk, now)
+            )
+            for origin, destination, duration, distance in rows:
+                if destination in destinations:
+                    found[(origin, destination)] = (duration, distance)
+        return found
+
+    def put_many(self, entries, profile):
+        """Store (origin, destination, duration, distance) tuples"""
+        expires_at = time.time() + self.ttl_seconds
+        rows = [
+            (origin, destination, profile, duration, distance, expires_at)
+            for origin, destination, duration, distance in entries
+        ]
+        if not rows:
+            return
+        with self.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO travel_matrix "
+                "(origin, destination, profile, duration, distance, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+
+class ORSMatrixProvider:
+    """
+    Road-network travel matrix for sets of postal codes.
+    All-pairs values are fetched with batched ors_client.distance_matrix calls,
+    split into blocks that stay within the API's location limit, and every
+    (origin, destination, profile) entry is cached on disk for later runs.
+    Has the same submatrix() interface as RoadMatrix, so it plugs into
+    DistanceEngine's 'road' metric.
+    """
+
+    def __init__(self, ors_client, coord_lookup, profile='driving-car', metric='duration',
+                 cache=None, max_locations=50, requests_per_minute=40, max_retries=3, backoff=2.0):
+        if metric not in ('duration', 'distance'):
+            raise ValueError("metric must be 'duration' or 'distance'")
+        self.ors_client = ors_client
+        # Mapping of postal code -> (lat, lon), e.g. the optimizer's coord_cache
+        self.coord_lookup = coord_lookup
+        self.profile = profile
+        self.metric = metric
+        self.cache = cache if cache is not None else get_default_matrix_cache()
+        # Each request carries one block of sources plus one block of destinations
+        self.block_size = max(1, max_locations // 2)
+        self.rate_limit = TokenBucket(requests_per_minute / 60.0)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {'cached_pairs': 0, 'fetched_pairs': 0, 'requests': 0, 'rate_limited': 0}
+
+    def _keys(self, postal_codes):
+        keys = []
+        for code in postal_codes:
+            coords = self.coord_lookup.get(code)
+            if coords is None:
+                raise KeyError(f"No coordinates for postal code {code}; geocode it before building a road matrix")
+            keys.append(location_key(coords))
+        return keys
+
+    def _fetch_block(self, sources, destinations):
+        """
+        One distance_matrix call for a block of source and destination location keys,
+        retried with backoff only when rate limited (429)
+        """
+        from openrouteservice.exceptions import ApiError
+
+        locations = [
+            [float(lon), float(lat)]
+            for lat, lon in (map(float, key.split(',')) for key in sources + destinations)
+        ]
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            self.rate_limit.acquire()
+            self.stats['requests'] += 1
+            started = time.perf_counter()
+            try:
+                result = self.ors_client.distance_matrix(
+                    locations=locations,
+                    profile=self.profile,
+                    sources=list(range(len(sources))),
+                    destinations=list(range(len(sources), len(sources) + len(destinations))),
+                    metrics=['duration', 'distance']
+                )
+            except ApiError as e:
+                record_network_call('ors_matrix', time.perf_counter() - started, ok=False)
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                self.stats['rate_limited'] += 1
+                record_retry('ors_matrix')
+                time.sleep(delay)
+                delay *= 2
+                continue
+            except Exception:
+                record_network_call('ors_matrix', time.perf_counter() - started, ok=False)
+                raise
+            record_network_call('ors_matrix', time.perf_counter() - started)
+            break
+        entries = []
+        for i, origin in enumerate(sources):
+            for j, destination in enumerate(destinations):
+                duration = result['durations'][i][j]
+                distance = result['distances'][i][j]
+                entries.append((origin, destination, duration, distance))
+        return entries
+
+    def submatrix(self, codes_a, codes_b=None):
+        """Travel matrix (seconds or metres) from every code in codes_a to every code in codes_b"""
+        keys_a = self._keys(codes_a)
+        keys_b = keys_a if codes_b is None else self._keys(codes_b)
+        unique_a = list(dict.fromkeys(keys_a))
+        unique_b = list(dict.fromkeys(keys_b))
+
+        values = self.cache.get_many(unique_a, unique_b, self.profile)
+        cached = len(values)
+        self.stats['cached_pairs'] += cached
+
+        # Only request blocks that still contain an uncached pair
+        fetched = []
+        for i in range(0, len(unique_a), self.block_size):
+            sources = unique_a[i:i + self.block_size]
+            for j in range(0, len(unique_b), self.block_size):
+                destinations = unique_b[j:j + self.block_size]
+                if all((o, d) in values for o in sources for d in destinations):
+                    continue
+                entries = self._fetch_block(sources, destinations)
+                for origin, destination, duration, distance in entries:
+                    values[(origin, destination)] = (duration, distance)
+                fetched.extend(entries)
+        self.stats['fetched_pairs'] += len(fetched)
+        record_cache('travel_matrix', cached, len(fetched))
+        self.cache.put_many(fetched, self.profile)
+
+        # Assemble the unique-key matrix, then expand to the requested rows/columns
+        column = 0 if self.metric == 'duration' else 1
+        index_a = {key: i for i, key in enumerate(unique_a)}
+        index_b = {key: j for j, key in enumerate(unique_b)}
+        unique_matrix = np.full((len(unique_a), len(unique_b)), UNREACHABLE)
+        for (origin, destination), pair in values.items():
+            if pair[column] is not None and origin in index_a and destination in index_b:
+                unique_matrix[index_a[origin], index_b[destination]] = pair[column]
+        rows = np.array([index_a[key] for key in keys_a], dtype=np.intp)
+        cols = np.array([index_b[key] for key in keys_b], dtype=np.intp)
+        return unique_matrix[np.ix_(rows, cols)]
+
+
+_default_matrix_cache = None
+_default_matrix_cache_lock = threading.Lock()
+
+
+def get_default_matrix_cache():
+    """Return the process-wide TravelMatrixCache, creating it on first use"""
+    global _default_matrix_cache
+    with _default_matrix_cache_lock:
+        if _default_matrix_cache is None:
+            _default_matrix_cache = TravelMatrixCache()
+        return _default_matrix_cache
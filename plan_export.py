@@ -0,0 +1,112 @@
+import csv
+import io
+import os
+
+import numpy as np
+
+from directions import get_default_directions_cache
+from distance_matrix import haversine_pairs
+from ors_matrix import location_key
+from plan_model import CompactPlan
+
+# One row per stop; leg_* describe the drive from the previous stop (or the start point)
+COLUMNS = ('route', 'sequence', 'postal_code', 'lat', 'lon',
+           'leg_distance_km', 'leg_source', 'eta_minutes')
+# Assumed average speed for legs without a cached road route
+DEFAULT_SPEED_KMH = 30.0
+# Rows written per chunk of a streamed CSV response
+CSV_CHUNK_ROWS = 500
+# Optional binary formats and the packages they need
+EXPORT_FORMATS = {
+    'csv': ('text/csv', None),
+    'parquet': ('application/vnd.apache.parquet', 'pandas and pyarrow'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'pandas and openpyxl')
+}
+
+
+def _route_rows(route_number, indices, labels, coords, known, keys, cached_legs, speed_kmh):
+    """
+    Rows for one route; indices point into the plan's codes/coords and start
+    with the start point, which gets no row
+    """
+    points = coords[indices]
+    straight_km = haversine_pairs(points[:-1], points[1:])
+    known = known[indices]
+    indices = indices.tolist()
+
+    eta_minutes = 0.0
+    for sequence in range(1, len(indices)):
+        leg = None
+        if known[sequence - 1] and known[sequence]:
+            leg = cached_legs.get((keys[indices[sequence - 1]], keys[indices[sequence]]))
+        if leg is not None and leg['distance'] is not None and leg['duration'] is not None:
+            distance_km = leg['distance'] / 1000
+            eta_minutes += leg['duration'] / 60
+            source = 'road'
+        elif np.isfinite(straight_km[sequence - 1]):
+            distance_km = float(straight_km[sequence - 1])
+            eta_minutes += distance_km / speed_kmh * 60
+            source = 'straight'
+        else:
+            # Can't place this leg; leave the distance blank but keep the running ETA
+            distance_km = None
+            source = 'unknown'
+        lat, lon = (round(value, 6) for value in points[sequence].tolist()) if known[sequence] else (None, None)
+        yield (route_number, sequence, labels[indices[sequence]], lat, lon,
+               None if distance_km is None else round(distance_km, 3),
+               source, round(eta_minutes, 1))
+
+
+def plan_rows(plan, speed_kmh=None, directions_cache=None, profile='driving-car'):
+    """
+    Yield one tuple per stop (see COLUMNS) from a stored plan (a CompactPlan, or
+    its to_dict() form). Legs use road distance and duration when the map
+    directions are already cached (no API calls are made); otherwise
+    straight-line distance at speed_kmh.
+    """
+    if isinstance(plan, dict):
+        plan = CompactPlan.from_dict(plan)
+    if speed_kmh is None:
+        speed_kmh = float(os.getenv('EXPORT_SPEED_KMH', DEFAULT_SPEED_KMH))
+    cache = directions_cache if directions_cache is not None else get_default_directions_cache()
+    labels = plan.labels()
+    known = plan.known()
+    # One cache key per distinct location rather than per stop
+    keys = [location_key(point) if ok else None for point, ok in zip(plan.coords.tolist(), known.tolist())]
+    for route_number in range(1, len(plan) + 1):
+        indices = np.concatenate(([0], plan.route_indices(route_number - 1)))
+        stop_keys = [keys[i] for i in indices.tolist()]
+        pairs = [(a, b) for a, b in zip(stop_keys[:-1], stop_keys[1:]) if a is not None and b is not None]
+        cached_legs = cache.get_many(pairs, profile)
+        yield from _route_rows(route_number, indices, labels, plan.coords, known, keys, cached_legs, speed_kmh)
+
+
+def iter_csv(rows, chunk_rows=CSV_CHUNK_ROWS):
+    """Stream rows as CSV text, header first, a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_binary(rows, file_format):
+    """Build a Parquet or XLSX file in memory; needs pandas plus pyarrow / openpyxl"""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError(f"{file_format} export needs {EXPORT_FORMATS[file_format][1]} installed")
+    frame = pd.DataFrame.from_records(list(rows), columns=COLUMNS)
+    output = io.BytesIO()
+    if file_format == 'parquet':
+        frame.to_parquet(output, index=False)
+    elif file_format == 'xlsx':
+        frame.to_excel(output, index=False, sheet_name='Routes')
+    else:
+        raise ValueError(f"Unknown export format '{file_format}'")
+    return output.getvalue()
@@ -0,0 +1,129 @@
+import io
+
+import numpy as np
+
+
+def encode_postal_codes(postal_codes):
+    """
+    Postal codes as a uint32 array when every code is six digits (leading
+    zeros are restored by decode_postal_codes), otherwise as a unicode array
+    """
+    codes = [str(code) for code in postal_codes]
+    if all(len(code) == 6 and code.isdigit() for code in codes):
+        return np.array(codes, dtype='U6').astype(np.uint32)
+    return np.array(codes, dtype=str)
+
+
+def decode_postal_codes(codes):
+    """List of postal code strings from encode_postal_codes output"""
+    if codes.dtype == np.uint32:
+        return [f'{code:06d}' for code in codes.tolist()]
+    return codes.tolist()
+
+
+class CompactPlan:
+    """
+    A route plan held in a few arrays rather than lists of strings and a dict of tuples:
+    - codes: every distinct postal code, start point first (see encode_postal_codes)
+    - coords: (N, 2) float64 (lat, lon) per code, NaN where a code couldn't be geocoded
+    - offsets, stops: routes in CSR form; route i visits codes[stops[offsets[i]:offsets[i + 1]]]
+    Converted to the JSON layout (to_dict) or to bytes (to_bytes) only at the edges.
+    """
+
+    __slots__ = ('start_postal', 'num_groups', 'codes', 'coords', 'offsets', 'stops')
+
+    def __init__(self, start_postal, num_groups, codes, coords, offsets, stops):
+        self.start_postal = start_postal
+        self.num_groups = num_groups
+        self.codes = codes
+        self.coords = coords
+        self.offsets = offsets
+        self.stops = stops
+
+    @classmethod
+    def from_routes(cls, start_postal, routes, coord_lookup, num_groups=None):
+        """Build from lists of postal codes, taking coordinates from a code -> (lat, lon) mapping"""
+        index = {start_postal: 0}
+        lengths = [len(route) for route in routes]
+        stops = np.empty(sum(lengths), dtype=np.int32)
+        position = 0
+        for route in routes:
+            for code in route:
+                stops[position] = index.setdefault(code, len(index))
+                position += 1
+        offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        coords = np.full((len(index), 2), np.nan)
+        for code, i in index.items():
+            point = coord_lookup.get(code)
+            if point is not None:
+                coords[i] = point
+        return cls(start_postal, len(routes) if num_groups is None else num_groups,
+                   encode_postal_codes(index), coords, offsets, stops)
+
+    @classmethod
+    def from_dict(cls, plan):
+        """Build from the JSON layout written by to_dict"""
+        coordinates = {code: tuple(point) for code, point in plan['coordinates'].items()}
+        return cls.from_routes(plan['start_postal'], plan['routes'], coordinates, plan.get('num_groups'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def stop_count(self):
+        return len(self.stops)
+
+    def labels(self):
+        """Every distinct postal code as a string, in code order"""
+        return decode_postal_codes(self.codes)
+
+    def known(self):
+        """Boolean mask of codes that have coordinates"""
+        return ~np.isnan(self.coords).any(axis=1)
+
+    def route_indices(self, i):
+        """Indices into codes/coords of route i's stops, in visiting order"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Route {i} is out of range for a plan with {len(self)} routes")
+        return self.stops[self.offsets[i]:self.offsets[i + 1]]
+
+    def route(self, i):
+        return decode_postal_codes(self.codes[self.route_indices(i)])
+
+    def routes(self):
+        labels = self.labels()
+        stops = self.stops.tolist()
+        offsets = self.offsets.tolist()
+        return [[labels[j] for j in stops[start:end]] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def coordinates(self):
+        """{postal code: (lat, lon)} for every code that has coordinates"""
+        known = self.known()
+        return {
+            code: tuple(point)
+            for code, point, ok in zip(self.labels(), self.coords.tolist(), known.tolist()) if ok
+        }
+
+    def to_dict(self):
+        """The plan as plain JSON-serializable data: start point, routes and stop coordinates"""
+        return {
+            'start_postal': self.start_postal,
+            'num_groups': self.num_groups,
+            'routes': self.routes(),
+            'coordinates': {code: list(point) for code, point in self.coordinates().items()}
+        }
+
+    def to_bytes(self):
+        """Binary form (uncompressed .npz) for on-disk session stores"""
+        output = io.BytesIO()
+        np.savez(output, start_postal=np.array(self.start_postal), num_groups=np.array(self.num_groups),
+                 codes=self.codes, coords=self.coords, offsets=self.offsets, stops=self.stops)
+        return output.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(str(arrays['start_postal']), int(arrays['num_groups']), arrays['codes'],
+                       arrays['coords'], arrays['offsets'], arrays['stops'])
@@ -8,14 +8,15 @@ from openrouteservice import convert
 import os
 from dotenv import load_dotenv
 import requests
-import time  # Add this import at the top
+from coordinate_resolver import CoordinateResolver
+from directions import DirectionsService
 
 # Load environment variables
 load_dotenv()
 
 # Main class that handles route optimization and map generation
 class PostalRouteOptimizer:
-    def __init__(self, postal_codes, num_groups=5):
+    def __init__(self, postal_codes, num_groups=5, geocode_store=None, gazetteer=None):
         # Initialize with list of postal codes and desired number of groups
         self.postal_codes = postal_codes
         self.num_groups = num_groups
@@ -24,13 +25,24 @@ class PostalRouteOptimizer:
         # Initialize geocoding services
         self.geolocator = Nominatim(user_agent="postal_route_optimizer")
         self.ors_client = ors.Client(key=os.getenv('ORS_API_KEY'))
+        # Cached, rate-limited road geometry for map rendering
+        self.directions = DirectionsService(self.ors_client)
+        # Single coordinate-resolution layer (memory -> geocode store -> network)
+        self.resolver = CoordinateResolver(self._geocode_remote, store=geocode_store, gazetteer=gazetteer)
+        self.coord_cache = self.resolver.cache
         
     def geocode_postal(self, postal_code):
         """
         Converts postal codes to coordinates using:
-        1. OneMap API (Singapore's official service)
-        2. Fallback to Nominatim if OneMap fails
+        1. The in-memory coordinate cache
+        2. The persistent geocode store (no network call for known codes)
+        3. OneMap API (Singapore's official service)
+        4. Fallback to Nominatim if OneMap fails
         """
+        return self.resolver.resolve(postal_code)
+
+    def _geocode_remote(self, postal_code):
+        """Geocode over the network, returning a record with lat, lon, source and address"""
         # Try OneMap API first (Singapore's official geocoding service)
         try:
             # Use HTTPS URL and verify SSL
@@ -56,7 +68,7 @@ class PostalRouteOptimizer:
                     lon = float(result['LONGITUDE'])
                     address = result.get('ADDRESS', 'No address found')
                     print(f"Found location for {postal_code}: {address}")
-                    return (lat, lon)
+                    return {'lat': lat, 'lon': lon, 'source': 'onemap', 'address': address}
                 else:
                     print(f"No results found for postal code: {postal_code}")
             else:
@@ -79,7 +91,12 @@ class PostalRouteOptimizer:
             
             if location:
                 print(f"Found location for {postal_code} using fallback: {location.address}")
-                return (location.latitude, location.longitude)
+                return {
+                    'lat': location.latitude,
+                    'lon': location.longitude,
+                    'source': 'nominatim',
+                    'address': location.address
+                }
             
         except Exception as e:
             print(f"Fallback geocoding failed for {postal_code}: {str(e)}")
@@ -92,14 +109,9 @@ class PostalRouteOptimizer:
         coordinates = []
         print(f"Processing route: {route}")
         
-        # Process starting point
-        start_coords = self.geocode_postal(self.start_postal)
-        if start_coords:
-            coordinates.append((start_coords, self.start_postal))
-        
-        # Process each stop in the route
-        for i, postal in enumerate(route, 1):
-            coords = self.geocode_postal(postal)
+        # Resolve the starting point and every stop through the coordinate cache
+        stops = [self.start_postal] + list(route)
+        for postal, coords in zip(stops, self.resolver.resolve_many(stops)):
             if coords:
                 coordinates.append((coords, postal))
 
@@ -119,53 +131,27 @@ class PostalRouteOptimizer:
                 icon=folium.Icon(color='red' if i == 0 else 'blue', icon='info-sign')
             ).add_to(m)
 
-        # Get route directions between consecutive points with rate limiting
-        for i in range(len(coordinates) - 1):
-            retry_count = 0
-            max_retries = 3
-            delay_seconds = 2  # Start with 2 second delay
-
-            while retry_count < max_retries:
-                try:
-                    coords1 = coordinates[i][0]
-                    coords2 = coordinates[i + 1][0]
-                    
-                    # Add delay before each API call
-                    time.sleep(delay_seconds)
-                    
-                    route_coords = self.ors_client.directions(
-                        coordinates=[[coords1[1], coords1[0]], [coords2[1], coords2[0]]],
-                        profile='driving-car',
-                        format='geojson'
-                    )
-                    
-                    if route_coords and 'features' in route_coords and len(route_coords['features']) > 0:
-                        # Add route to map
-                        folium.GeoJson(
-                            route_coords,
-                            style_function=lambda x: {
-                                'color': 'blue',
-                                'weight': 3,
-                                'opacity': 0.7
-                            }
-                        ).add_to(m)
-                        break  # Success, exit retry loop
-                    
-                except Exception as e:
-                    print(f"Attempt {retry_count + 1} failed: {str(e)}")
-                    retry_count += 1
-                    delay_seconds *= 2  # Exponential backoff
-                    
-                    if retry_count == max_retries:
-                        print("Falling back to straight line...")
-                        # Fallback to straight line if all retries fail
-                        folium.PolyLine(
-                            locations=[coords1, coords2],
-                            weight=2,
-                            color='red',
-                            opacity=0.5,
-                            dash_array='10'
-                        ).add_to(m)
+        # Road geometry for every leg: cached legs are free, the rest come from
+        # multi-waypoint ORS calls (or concurrent single legs if those fail)
+        legs = self.directions.route_legs([coords for coords, _ in coordinates])
+        for i, leg in enumerate(legs):
+            if leg is not None:
+                # Add route to map
+                folium.PolyLine(
+                    locations=leg['geometry'],
+                    weight=3,
+                    color='blue',
+                    opacity=0.7
+                ).add_to(m)
+            else:
+                # Fallback to straight line if no directions could be fetched
+                folium.PolyLine(
+                    locations=[coordinates[i][0], coordinates[i + 1][0]],
+                    weight=2,
+                    color='red',
+                    opacity=0.5,
+                    dash_array='10'
+                ).add_to(m)
 
         # Fit map bounds to include all points
         if len(coordinates) > 1:
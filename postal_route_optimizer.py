@@ -1,109 +1,153 @@
 import numpy as np
 from math import ceil
-import folium
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
-import openrouteservice as ors
-from openrouteservice import convert
 import os
-from dotenv import load_dotenv
-import requests
-import time  # Add this import at the top
-from sklearn.cluster import KMeans
-from collections import defaultdict
+from collections import Counter, defaultdict
+from coordinate_resolver import CoordinateResolver
+from batch_geocoder import get_default_geocoder
+from distance_matrix import DistanceEngine, haversine_matrix, nearest_neighbour_order
+from cluster_routing import route_cluster, route_clusters_parallel
+from ors_matrix import ORSMatrixProvider
+from directions import DirectionsService
+from map_data import encoded_route, route_geojson
+from instrumentation import timed_stage
+from providers import get_default_ors_client, load_environment
+from plan_model import CompactPlan
+from stop_index import StopIndex
+from local_search import improve_route
+from clustering import MINIBATCH_MIN_POINTS, balanced_kmeans, minibatch_kmeans
+from centroid_store import get_default_centroid_store
+from sector_decomposition import order_sectors, partition_by_sector
 
-# Load environment variables
-load_dotenv()
+# folium, scikit-learn and openrouteservice are imported where they're first needed,
+# so importing this module (and starting the CLI or a worker) stays fast
 
 # Main class that handles route optimization and map generation
 class PostalRouteOptimizer:
-    def __init__(self, postal_codes, num_groups=5):
+    def __init__(self, postal_codes, num_groups=5, geocode_store=None, geocoder=None, gazetteer=None,
+                 distance_metric='postal', road_matrix=None, local_search=None,
+                 local_search_time=1.0, clustering='auto', progress_callback=None,
+                 route_workers=None, route_chunksize=None, centroid_store=None, warm_start=True):
+        # Load environment variables
+        load_environment()
         # Initialize with list of postal codes and desired number of groups
         self.postal_codes = postal_codes
         self.num_groups = num_groups
+        # Unique sites with their multiplicity; repeated codes are geocoded, clustered and routed once
+        self.stops = StopIndex(postal_codes)
         # Calculate group size based on number of postal codes and desired groups
         self.group_size = ceil(len(postal_codes) / num_groups)
-        # Initialize geocoding services
-        self.geolocator = Nominatim(user_agent="postal_route_optimizer")
-        self.ors_client = ors.Client(key=os.getenv('ORS_API_KEY'))
+        # Initialize geocoding services (batch engine shared process-wide)
+        self.geocoder = geocoder if geocoder is not None else get_default_geocoder()
+        # ORS client (shared process-wide) and directions are created on first use
+        self._directions = None
+        # Single coordinate-resolution layer (memory -> geocode store -> network)
+        self.resolver = CoordinateResolver(
+            self._geocode_remote,
+            store=geocode_store,
+            geocode_many_fn=self.geocoder.geocode_many,
+            gazetteer=gazetteer
+        )
         # Store coordinates to avoid repeated geocoding
-        self.coord_cache = {}
+        self.coord_cache = self.resolver.cache
+        self.geocode_store = self.resolver.store
+        # Vectorized distance matrices ('postal', 'haversine', 'road' or 'ors')
+        if distance_metric == 'ors':
+            # Real drive times from ORS, cached on disk per (origin, destination, profile)
+            road_matrix = ORSMatrixProvider(self.ors_client, self.coord_cache)
+            distance_metric = 'road'
+        self.distance_engine = DistanceEngine(
+            distance_metric,
+            coord_lookup=self.coord_cache,
+            road_matrix=road_matrix
+        )
+        # 'kmeans' (unconstrained, routes split by group_size), 'minibatch' (mini-batch K-means,
+        # for very large inputs), 'balanced' (exactly num_groups routes), 'sector' (one partition
+        # per postal sector, routed separately and stitched into one tour) or 'auto' (kmeans,
+        # or minibatch from MINIBATCH_MIN_POINTS sites)
+        if clustering not in ('auto', 'kmeans', 'minibatch', 'balanced', 'sector'):
+            raise ValueError(f"Unknown clustering mode '{clustering}'")
+        self.clustering = clustering
+        self.cluster_centroids = None
+        # Mini-batch clustering starts from the depot's last centroids for this num_groups
+        # and saves its own for the next plan (store is created on first use)
+        self.warm_start = warm_start
+        self._centroid_store = centroid_store
+        # Optional improvement stage after nearest neighbour: '2opt', 'oropt', '2opt+oropt'
+        # or a callable(matrix, order) -> (order, stats)
+        self.local_search = local_search
+        self.local_search_time = local_search_time
+        self.local_search_stats = []
+        # Processes for routing clusters in parallel (1 routes them in this process)
+        # and clusters handed to a worker at a time
+        if route_workers is None:
+            route_workers = int(os.getenv('ROUTE_WORKERS', 1))
+        if route_chunksize is None:
+            route_chunksize = int(os.getenv('ROUTE_CHUNKSIZE', 1))
+        self.route_workers = route_workers
+        self.route_chunksize = route_chunksize
+        # progress_callback(phase, fraction) is told about geocoding, clustering, routing and rendering
+        self.progress_callback = progress_callback
+        # Last plan from optimize_route, updated by apply_changes
+        self.start_postal = None
+        self.routes = None
+        self.route_centroids = []
+        # Legs drawn as straight lines on the last create_route_map (directions unavailable)
+        self.map_fallback_legs = 0
         
+    def _report(self, phase, fraction):
+        """Report progress within a phase (0..1) to the progress callback, if any"""
+        if self.progress_callback is not None:
+            self.progress_callback(phase, fraction)
+
     def geocode_postal(self, postal_code):
         """
         Converts postal codes to coordinates using:
-        1. OneMap API (Singapore's official service)
-        2. Fallback to Nominatim if OneMap fails
+        1. The in-memory coordinate cache
+        2. The persistent geocode store (no network call for known codes)
+        3. OneMap API (Singapore's official service)
+        4. Fallback to Nominatim if OneMap fails
         """
-        # Try OneMap API first (Singapore's official geocoding service)
-        try:
-            # Use HTTPS URL and verify SSL
-            onemap_url = "https://www.onemap.gov.sg/api/common/elastic/search"
-            params = {
-                'searchVal': postal_code,
-                'returnGeom': 'Y',
-                'getAddrDetails': 'Y'
-            }
-            
-            response = requests.get(
-                onemap_url, 
-                params=params,
-                verify=True,  # Verify SSL certificate
-                timeout=10    # Set timeout
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['results']:
-                    result = data['results'][0]
-                    lat = float(result['LATITUDE'])
-                    lon = float(result['LONGITUDE'])
-                    address = result.get('ADDRESS', 'No address found')
-                    print(f"Found location for {postal_code}: {address}")
-                    return (lat, lon)
-                else:
-                    print(f"No results found for postal code: {postal_code}")
-            else:
-                print(f"OneMap API returned status code: {response.status_code}")
-            
-        except Exception as e:
-            print(f"OneMap API failed for {postal_code}: {str(e)}")
+        return self.resolver.resolve(postal_code)
 
-        # If OneMap fails, try using a Singapore postal code geocoding service
-        try:
-            # Format postal code query
-            query = f"Singapore {postal_code}"
-            location = self.geolocator.geocode(
-                query,
-                timeout=10,
-                country_codes="sg",
-                exactly_one=True,
-                view_box=(103.6, 1.1, 104.1, 1.5)  # Singapore bounding box
-            )
-            
-            if location:
-                print(f"Found location for {postal_code} using fallback: {location.address}")
-                return (location.latitude, location.longitude)
-            
-        except Exception as e:
-            print(f"Fallback geocoding failed for {postal_code}: {str(e)}")
-        
-        print(f"All geocoding attempts failed for {postal_code}")
-        return None
+    @property
+    def ors_client(self):
+        return get_default_ors_client()
+
+    @property
+    def directions(self):
+        """Cached, rate-limited road geometry for map rendering"""
+        if self._directions is None:
+            self._directions = DirectionsService(self.ors_client)
+        return self._directions
+
+    @property
+    def centroid_store(self):
+        if self._centroid_store is None:
+            self._centroid_store = get_default_centroid_store()
+        return self._centroid_store
 
+    def clustering_backend(self, num_points):
+        """The clustering mode actually used for num_points sites"""
+        if self.clustering != 'auto':
+            return self.clustering
+        threshold = int(os.getenv('CLUSTERING_MINIBATCH_MIN_POINTS', MINIBATCH_MIN_POINTS))
+        return 'minibatch' if num_points >= threshold else 'kmeans'
+
+    def _geocode_remote(self, postal_code):
+        """Geocode over the network, returning a record with lat, lon, source and address"""
+        return self.geocoder.geocode(postal_code)
+
+    @timed_stage('render')
     def create_route_map(self, route):
         """Creates an interactive map showing routes"""
+        import folium
+
         coordinates = []
         print(f"Processing route: {route}")
         
-        # Process starting point
-        start_coords = self.geocode_postal(self.start_postal)
-        if start_coords:
-            coordinates.append((start_coords, self.start_postal))
-        
-        # Process each stop in the route
-        for i, postal in enumerate(route, 1):
-            coords = self.geocode_postal(postal)
+        # Resolve the starting point and every stop through the coordinate cache
+        stops = [self.start_postal] + list(route)
+        for postal, coords in zip(stops, self.resolver.resolve_many(stops)):
             if coords:
                 coordinates.append((coords, postal))
 
@@ -123,53 +167,31 @@ class PostalRouteOptimizer:
                 icon=folium.Icon(color='red' if i == 0 else 'blue', icon='info-sign')
             ).add_to(m)
 
-        # Get route directions between consecutive points with rate limiting
-        for i in range(len(coordinates) - 1):
-            retry_count = 0
-            max_retries = 3
-            delay_seconds = 2  # Start with 2 second delay
-
-            while retry_count < max_retries:
-                try:
-                    coords1 = coordinates[i][0]
-                    coords2 = coordinates[i + 1][0]
-                    
-                    # Add delay before each API call
-                    time.sleep(delay_seconds)
-                    
-                    route_coords = self.ors_client.directions(
-                        coordinates=[[coords1[1], coords1[0]], [coords2[1], coords2[0]]],
-                        profile='driving-car',
-                        format='geojson'
-                    )
-                    
-                    if route_coords and 'features' in route_coords and len(route_coords['features']) > 0:
-                        # Add route to map
-                        folium.GeoJson(
-                            route_coords,
-                            style_function=lambda x: {
-                                'color': 'blue',
-                                'weight': 3,
-                                'opacity': 0.7
-                            }
-                        ).add_to(m)
-                        break  # Success, exit retry loop
-                    
-                except Exception as e:
-                    print(f"Attempt {retry_count + 1} failed: {str(e)}")
-                    retry_count += 1
-                    delay_seconds *= 2  # Exponential backoff
-                    
-                    if retry_count == max_retries:
-                        print("Falling back to straight line...")
-                        # Fallback to straight line if all retries fail
-                        folium.PolyLine(
-                            locations=[coords1, coords2],
-                            weight=2,
-                            color='red',
-                            opacity=0.5,
-                            dash_array='10'
-                        ).add_to(m)
+        # Road geometry for every leg: cached legs are free, the rest come from
+        # multi-waypoint ORS calls (or concurrent single legs if those fail)
+        legs = self.directions.route_legs(
+            [coords for coords, _ in coordinates],
+            progress=lambda done, total: self._report('rendering', done / total)
+        )
+        self.map_fallback_legs = sum(1 for leg in legs if leg is None)
+        for i, leg in enumerate(legs):
+            if leg is not None:
+                # Add route to map
+                folium.PolyLine(
+                    locations=leg['geometry'],
+                    weight=3,
+                    color='blue',
+                    opacity=0.7
+                ).add_to(m)
+            else:
+                # Fallback to straight line if no directions could be fetched
+                folium.PolyLine(
+                    locations=[coordinates[i][0], coordinates[i + 1][0]],
+                    weight=2,
+                    color='red',
+                    opacity=0.5,
+                    dash_array='10'
+                ).add_to(m)
 
         # Fit map bounds to include all points
         if len(coordinates) > 1:
@@ -178,6 +200,31 @@ class PostalRouteOptimizer:
 
         return m
 
+    @timed_stage('render')
+    def route_map_data(self, route, format='polyline'):
+        """
+        Markers and leg lines for a route as plain JSON data, for a client-side map:
+        'polyline' (default) gives compact encoded polylines, 'geojson' a FeatureCollection.
+        Uses the same cached directions as create_route_map without building a folium page.
+        """
+        if format not in ('polyline', 'geojson'):
+            raise ValueError(f"Unknown map data format '{format}'")
+        stops = [self.start_postal] + list(route)
+        located = [
+            (postal, coords)
+            for postal, coords in zip(stops, self.resolver.resolve_many(stops)) if coords
+        ]
+        if len(located) < 2:
+            return None
+
+        legs = self.directions.route_legs(
+            [coords for _, coords in located],
+            progress=lambda done, total: self._report('rendering', done / total)
+        )
+        if format == 'geojson':
+            return route_geojson(located, legs)
+        return encoded_route(located, legs)
+
     def calculate_distance(self, code1, code2):
         """
         Calculates "distance" between postal codes based on:
@@ -202,69 +249,166 @@ class PostalRouteOptimizer:
 
     def find_nearest_unvisited(self, current, unvisited):
         """Find the nearest unvisited postal code to the current one"""
-        distances = [(code, self.calculate_distance(current, code)) for code in unvisited]
-        return min(distances, key=lambda x: x[1])[0]
+        unvisited = list(unvisited)
+        distances = self.distance_engine.matrix([current], unvisited)[0]
+        return unvisited[int(np.argmin(distances))]
 
     def get_coordinates(self, postal_codes):
-        """Get coordinates for all postal codes"""
-        coordinates = []
-        # Keep track of indices to maintain duplicates
-        postal_indices = []
-        
-        for i, code in enumerate(postal_codes):
-            if code not in self.coord_cache:
-                coords = self.geocode_postal(code)
-                if coords:
-                    self.coord_cache[code] = coords
-            if code in self.coord_cache:
-                coordinates.append(self.coord_cache[code])
-                postal_indices.append(i)  # Store original index
-            
-        return np.array(coordinates), postal_indices
+        """
+        Get coordinates for all postal codes: an (n, 2) array for the geocoded ones
+        and their indices into postal_codes (so duplicates are kept)
+        """
+        self._report('geocoding', 0.0)
+        resolved = self.resolver.resolve_many(
+            postal_codes,
+            progress=lambda done, total: self._report('geocoding', done / total)
+        )
+        # Fill one array in place rather than building parallel lists first
+        coordinates = np.full((len(resolved), 2), np.nan)
+        for i, coords in enumerate(resolved):
+            if coords:
+                coordinates[i] = coords
+        postal_indices = np.flatnonzero(~np.isnan(coordinates[:, 0]))
+        return coordinates[postal_indices], postal_indices
 
     def cluster_postal_codes(self):
-        """Cluster postal codes using K-means"""
+        """
+        Cluster the unique sites using K-means ('kmeans'), mini-batch K-means ('minibatch')
+        or balanced K-means ('balanced'), each weighted by how many input stops share it,
+        or group them by postal sector ('sector'). Returns {label: [site, ...]}.
+        """
+        sites = self.stops.sites
         # Get coordinates for clustering
-        coords, postal_indices = self.get_coordinates(self.postal_codes)
+        with timed_stage('geocode'):
+            coords, site_indices = self.get_coordinates(sites)
+        weights = self.stops.counts[site_indices]
+        self._report('clustering', 0.0)
         
         if len(coords) < self.num_groups:
-            return {0: self.postal_codes}  # Return single cluster if too few points
+            return {0: list(sites)}  # Return single cluster if too few points
             
-        # Perform K-means clustering
-        kmeans = KMeans(n_clusters=self.num_groups, random_state=42)
-        cluster_labels = kmeans.fit_predict(coords)
+        backend = self.clustering_backend(len(coords))
+        with timed_stage('cluster'):
+            if backend == 'balanced':
+                # Capacity-constrained K-means: exactly num_groups clusters of near-equal size
+                cluster_labels, self.cluster_centroids = balanced_kmeans(coords, self.num_groups, weights=weights)
+            elif backend == 'sector':
+                # No fitting at all: the first two postal digits already give compact partitions
+                return partition_by_sector([sites[idx] for idx in site_indices])
+            elif backend == 'minibatch':
+                # Warm start from the depot's previous centroids keeps clusters stable day to day
+                warm = self.warm_start and self.start_postal is not None
+                init = self.centroid_store.get(self.start_postal, self.num_groups) if warm else None
+                cluster_labels, self.cluster_centroids = minibatch_kmeans(
+                    coords, self.num_groups, weights=weights, init=init
+                )
+                if warm:
+                    self.centroid_store.put(self.start_postal, self.num_groups, self.cluster_centroids)
+            else:
+                from sklearn.cluster import KMeans
+
+                # Perform K-means clustering
+                kmeans = KMeans(n_clusters=self.num_groups, random_state=42)
+                cluster_labels = kmeans.fit_predict(coords, sample_weight=weights)
+                self.cluster_centroids = kmeans.cluster_centers_
         
-        # Group postal codes by cluster, maintaining duplicates
+        # Group sites by cluster
         clusters = defaultdict(list)
-        for idx, label in zip(postal_indices, cluster_labels):
-            clusters[label].append(self.postal_codes[idx])
+        for idx, label in zip(site_indices, cluster_labels):
+            clusters[label].append(sites[idx])
             
         return clusters
 
     def optimize_cluster_route(self, cluster_codes, start_postal):
-        """Optimize route within a cluster using nearest neighbor"""
+        """Optimize route within a cluster using nearest neighbor (each site once; see StopIndex.expand)"""
         if not cluster_codes:
             return []
             
-        route = []
-        unvisited = set(cluster_codes)
-        current = start_postal
+        # Visit each site once, always starting from start_postal
+        stops = [start_postal] + [code for code in dict.fromkeys(cluster_codes) if code != start_postal]
         
-        while unvisited:
-            if current in unvisited:
-                unvisited.remove(current)
-            route.append(current)
-            
-            if not unvisited:
-                break
-                
-            # Find nearest unvisited postal code
-            current = min(
-                unvisited,
-                key=lambda x: self.calculate_distance(current, x)
+        # One distance matrix for the whole cluster, then argmin-based nearest neighbour
+        matrix = self.distance_engine.matrix(stops)
+        order = nearest_neighbour_order(matrix, 0)
+        if self.local_search:
+            order = self.improve_cluster_route(matrix, order)
+        return [stops[i] for i in order]
+
+    def route_cluster(self, cluster_codes, start_postal):
+        """
+        Route one cluster from its code nearest to start_postal: the same tour as
+        find_nearest_unvisited + optimize_cluster_route, but large clusters are
+        walked on a spatial index instead of an n x n matrix
+        """
+        improve = self.improve_cluster_route if self.local_search else None
+        return route_cluster(self.distance_engine, cluster_codes, start_postal, improve)
+
+    def route_all_clusters(self, clusters, start_postal):
+        """
+        Yield the route of every cluster in order, on a pool of route_workers
+        processes when there is more than one cluster to share out.
+        start_postal is one code for every cluster or a list with one per cluster.
+        """
+        clusters = list(clusters)
+        if self.route_workers <= 1 or len(clusters) < 2:
+            starts = start_postal if isinstance(start_postal, list) else [start_postal] * len(clusters)
+            for cluster_codes, start in zip(clusters, starts):
+                yield self.route_cluster(cluster_codes, start)
+            return
+        for cluster_route, stats in route_clusters_parallel(
+            self.distance_engine,
+            clusters,
+            start_postal,
+            workers=self.route_workers,
+            chunksize=self.route_chunksize,
+            local_search=self.local_search,
+            local_search_time=self.local_search_time
+        ):
+            if stats is not None:
+                self._record_local_search(len(cluster_route), stats)
+            yield cluster_route
+
+    def route_sectors(self, sectors, start_postal):
+        """
+        Route every postal sector on its own (on route_workers processes), visit the
+        sectors in order_sectors order and cut the stitched tour into group_size routes.
+        Each nearest-neighbour walk only ever looks at one sector's stops.
+        """
+        visits = order_sectors(sectors, self.coord_cache, start_postal)
+        tour = []
+        sector_routes = self.route_all_clusters(
+            [sectors[sector] for sector, _ in visits],
+            [entry for _, entry in visits]
+        )
+        for done, sector_route in enumerate(sector_routes):
+            self._report('routing', (done + 1) / len(visits))
+            tour.extend(self.stops.expand(sector_route))
+        return [tour[i:i + self.group_size] for i in range(0, len(tour), self.group_size)]
+
+    def improve_cluster_route(self, matrix, order, focus=None):
+        """
+        Run the local-search stage on a route order and record before/after lengths.
+        Falls back to 2-opt + Or-opt when no local_search was configured
+        (used when apply_changes repairs a route around its changed stops).
+        """
+        local_search = self.local_search or '2opt+oropt'
+        if callable(local_search):
+            order, stats = local_search(matrix, order)
+        else:
+            order, stats = improve_route(
+                matrix,
+                order,
+                moves=tuple(local_search.split('+')),
+                time_budget=self.local_search_time,
+                focus=focus
             )
-            
-        return route
+        self._record_local_search(len(order), stats)
+        return order
+
+    def _record_local_search(self, stops, stats):
+        self.local_search_stats.append(stats)
+        print(f"Local search on {stops} stops: "
+              f"{stats['initial_length']:.1f} -> {stats['final_length']:.1f}")
 
     def optimize_route(self, start_postal):
         """
@@ -274,32 +418,195 @@ class PostalRouteOptimizer:
            - Find nearest postal code to start_postal
            - Optimize route within cluster
         3. Return optimized routes
+        With clustering='sector', step 2 is route_sectors instead.
         """
         self.start_postal = start_postal
+        # Resolve the start point now so map rendering never has to geocode it
+        self.resolver.resolve(start_postal)
+        self.local_search_stats = []
         
         # Get clusters
         clusters = self.cluster_postal_codes()
         routes = []
         
         # Process each cluster
-        for cluster_codes in clusters.values():
-            # Find nearest code to start_postal in this cluster
-            cluster_start = min(
-                cluster_codes,
-                key=lambda x: self.calculate_distance(start_postal, x)
-            )
-            
-            # Optimize route within cluster
-            cluster_route = self.optimize_cluster_route(cluster_codes, cluster_start)
-            
-            # Split into groups of appropriate size if needed
-            for i in range(0, len(cluster_route), self.group_size):
-                route_segment = cluster_route[i:i + self.group_size]
-                if route_segment:
-                    routes.append(route_segment)
+        with timed_stage('route'):
+            self._report('routing', 0.0)
+            if self.clustering == 'sector':
+                routes = self.route_sectors(clusters, start_postal)
+            else:
+                # Balanced clusters are already capacity-limited, so each is one route; splitting
+                # one that a repeated site pushed past group_size would add a tiny extra route
+                one_route_per_cluster = self.clustering == 'balanced' and len(clusters) > 1
+                # Each cluster starts at its code nearest to start_postal
+                for done, cluster_route in enumerate(self.route_all_clusters(clusters.values(), start_postal)):
+                    self._report('routing', (done + 1) / len(clusters))
+                    # Back to one entry per input stop, repeats kept together
+                    cluster_route = self.stops.expand(cluster_route)
+                    if one_route_per_cluster:
+                        routes.append(cluster_route)
+                        continue
+
+                    # Split into groups of appropriate size if needed
+                    for i in range(0, len(cluster_route), self.group_size):
+                        route_segment = cluster_route[i:i + self.group_size]
+                        if route_segment:
+                            routes.append(route_segment)
         
+        # Keep the plan so apply_changes can update it incrementally
+        self.routes = routes
+        self.route_centroids = [self._route_centroid(route) for route in routes]
         return routes
 
+    def _route_centroid(self, route):
+        """Mean (lat, lon) of the geocoded stops on a route, or None if none are geocoded"""
+        coords = [self.coord_cache[code] for code in route if code in self.coord_cache]
+        return np.mean(coords, axis=0) if coords else None
+
+    def apply_changes(self, added=(), removed=(), candidate_routes=3):
+        """
+        Incrementally update the plan from the last optimize_route call:
+        1. Drop removed postal codes from their routes
+        2. Insert each added code at its cheapest position in one of the
+           candidate_routes routes whose centroid is nearest (the previous
+           centroids act as a warm start instead of re-clustering)
+        3. Re-optimize only the routes that changed, with local search
+        Routes that weren't touched are returned unchanged.
+        """
+        if self.routes is None:
+            raise ValueError("apply_changes needs a plan from optimize_route first")
+        routes = [list(route) for route in self.routes]
+        centroids = list(self.route_centroids)
+        changed = set()
+
+        # Stops next to a change; local search starts from these only
+        dirty = set()
+
+        removed = set(removed)
+        if removed:
+            for i, route in enumerate(routes):
+                kept = [code for code in route if code not in removed]
+                if len(kept) != len(route):
+                    dirty.update(
+                        route[j + step] for j, code in enumerate(route) if code in removed
+                        for step in (-1, 1) if 0 <= j + step < len(route)
+                    )
+                    routes[i] = kept
+                    changed.add(i)
+            self.postal_codes = [code for code in self.postal_codes if code not in removed]
+
+        planned = {code for route in routes for code in route}
+        new_codes = [code for code in dict.fromkeys(added) if code not in planned]
+        self.postal_codes = self.postal_codes + list(added)
+        self.group_size = ceil(len(self.postal_codes) / self.num_groups)
+
+        for code, coords in zip(new_codes, self.resolver.resolve_many(new_codes)):
+            target, position = self._cheapest_insertion(routes, centroids, code, coords, candidate_routes)
+            if target is None:
+                routes.append([code])
+                centroids.append(None if coords is None else np.array(coords))
+                target = len(routes) - 1
+            else:
+                routes[target].insert(position, code)
+            dirty.add(code)
+            changed.add(target)
+
+        # Further stops at an already planned site go right next to it
+        extra = Counter(added)
+        for code in new_codes:
+            extra[code] -= 1
+        for i, route in enumerate(routes):
+            for code in dict.fromkeys(route):
+                if extra.get(code, 0) > 0:
+                    position = route.index(code)
+                    route[position:position] = [code] * extra.pop(code)
+                    changed.add(i)
+
+        for i in sorted(changed):
+            if routes[i]:
+                routes[i] = self._reoptimize_route(routes[i], dirty)
+                centroids[i] = self._route_centroid(routes[i])
+
+        keep = [i for i, route in enumerate(routes) if route]
+        self.routes = [routes[i] for i in keep]
+        self.route_centroids = [centroids[i] for i in keep]
+        self.stops = StopIndex(self.postal_codes)
+        return self.routes
+
+    def _nearest_routes(self, centroids, coords, count):
+        """Indices of the routes whose centroid is closest to coords (all routes if unknown)"""
+        known = [i for i, centroid in enumerate(centroids) if centroid is not None]
+        if coords is None or not known:
+            return list(range(len(centroids)))
+        distances = haversine_matrix([coords], [centroids[i] for i in known])[0]
+        nearest = [known[i] for i in np.argsort(distances)[:count]]
+        # Routes without a centroid can't be ranked, so they stay candidates
+        return nearest + [i for i, centroid in enumerate(centroids) if centroid is None]
+
+    def _cheapest_insertion(self, routes, centroids, code, coords, candidate_routes):
+        """
+        Find (route index, position) with the smallest detour for a new stop.
+        Routes already at group_size are only used when every candidate is full.
+        """
+        best = None
+        for i in self._nearest_routes(centroids, coords, candidate_routes):
+            route = routes[i]
+            if not route:
+                continue
+            to_stop = self.distance_engine.matrix([code], route)[0]
+            # Only imported road matrices can be asymmetric
+            if self.distance_engine.metric == 'road':
+                from_stop = self.distance_engine.matrix(route, [code])[:, 0]
+            else:
+                from_stop = to_stop
+            # Inserting after position p costs d(p, new) + d(new, p + 1) - d(p, p + 1);
+            # after the last stop it is just d(last, new). The first stop stays first.
+            costs = from_stop.copy()
+            if len(route) > 1:
+                costs[:-1] += to_stop[1:] - self.distance_engine.pairs(route[:-1], route[1:])
+            position = int(np.argmin(costs))
+            candidate = (len(route) >= self.group_size, costs[position], i, position + 1)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        if best is None:
+            return None, None
+        return best[2], best[3]
+
+    def _reoptimize_route(self, route, dirty):
+        """
+        Repair a changed route with local search around its dirty stops, keeping its first stop.
+        Repeated stops at one site are routed as one and stay together.
+        """
+        sites = StopIndex(route)
+        matrix = self.distance_engine.matrix(sites.sites)
+        focus = [i for i, code in enumerate(sites.sites) if code in dirty]
+        order = self.improve_cluster_route(matrix, list(range(len(sites))), focus=focus)
+        return sites.expand([sites.sites[i] for i in order])
+
+    def to_plan(self):
+        """
+        The last plan as a CompactPlan: start point, routes and the coordinates of
+        every stop in a few arrays. Cheap to store per user, unlike the optimizer itself;
+        plan.to_dict() gives the JSON layout.
+        """
+        if self.routes is None:
+            raise ValueError("to_plan needs a plan from optimize_route first")
+        return CompactPlan.from_routes(self.start_postal, self.routes, self.coord_cache, self.num_groups)
+
+    @classmethod
+    def from_plan(cls, plan, **kwargs):
+        """Rebuild an optimizer from to_plan() output (or its to_dict() form) without geocoding again"""
+        if isinstance(plan, dict):
+            plan = CompactPlan.from_dict(plan)
+        routes = plan.routes()
+        postal_codes = [code for route in routes for code in route]
+        optimizer = cls(postal_codes, num_groups=plan.num_groups, **kwargs)
+        optimizer.coord_cache.update(plan.coordinates())
+        optimizer.start_postal = plan.start_postal
+        optimizer.routes = routes
+        optimizer.route_centroids = [optimizer._route_centroid(route) for route in optimizer.routes]
+        return optimizer
+
 def get_user_input():
     """Get postal codes and parameters from user input"""
     print("\n=== Postal Route Optimizer ===\n")
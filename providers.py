@@ -0,0 +1,68 @@
+import importlib
+import os
+import threading
+
+DEFAULT_ORS_BASE_URL = 'https://api.openrouteservice.org'
+# Seconds the client keeps retrying connection errors and 5xx responses (its default is 60)
+DEFAULT_ORS_RETRY_TIMEOUT = 10
+# Imported by preload_in_background: scikit-learn alone takes over a second to import
+PRELOAD_MODULES = ('sklearn.cluster',)
+
+_environment_loaded = False
+_environment_lock = threading.Lock()
+
+
+def load_environment():
+    """Load .env into os.environ once per process"""
+    global _environment_loaded
+    with _environment_lock:
+        if not _environment_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _environment_loaded = True
+
+
+# One openrouteservice client per process, shared by map rendering and road matrices
+_default_ors_client = None
+_default_ors_client_pid = None
+_default_ors_client_lock = threading.Lock()
+
+
+def get_default_ors_client():
+    """
+    Return the process-wide openrouteservice client, creating it on first use
+    (and again in a forked child, which mustn't reuse the parent's connections).
+    The client's own 429 handling is off: it would retry for up to a minute and
+    then raise Timeout, hiding the 429 from our rate-limit-aware retries.
+    """
+    global _default_ors_client, _default_ors_client_pid
+    with _default_ors_client_lock:
+        if _default_ors_client is None or _default_ors_client_pid != os.getpid():
+            load_environment()
+            import openrouteservice
+
+            _default_ors_client = openrouteservice.Client(
+                key=os.getenv('ORS_API_KEY'),
+                base_url=os.getenv('ORS_BASE_URL', DEFAULT_ORS_BASE_URL),
+                retry_over_query_limit=False,
+                retry_timeout=float(os.getenv('ORS_RETRY_TIMEOUT', DEFAULT_ORS_RETRY_TIMEOUT))
+            )
+            _default_ors_client_pid = os.getpid()
+        return _default_ors_client
+
+
+def preload_in_background(modules=PRELOAD_MODULES):
+    """
+    Import heavy modules on a daemon thread, so they are usually loaded by the
+    time the first request needs them instead of slowing down startup
+    """
+    def preload():
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass  # Reported properly by whoever actually needs it
+
+    thread = threading.Thread(target=preload, name='preload-modules', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,199 @@
+"""
+Non-interactive batch runner for nightly jobs.
+
+Reads postal codes from files and/or stdin ('-'), geocodes them once, then
+plans every scenario (start postal code, number of routes) against the same
+warm coordinates, optionally across a process pool.
+
+    python route_cli.py stops.txt --scenario 018956:5 --scenario 119077:8 --out results
+    cat stops.txt | python route_cli.py - --scenarios scenarios.csv --workers 4 --format json csv
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from plan_export import iter_csv, plan_rows
+from postal_route_optimizer import PostalRouteOptimizer
+from providers import preload_in_background
+from stop_index import StopIndex
+
+# Postal codes may be separated by newlines, commas, semicolons or whitespace
+SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def read_postal_codes(paths):
+    """Yield postal codes from each path in turn, streaming line by line ('-' is stdin)"""
+    for path in paths:
+        file = sys.stdin if path == '-' else open(path, 'r')
+        try:
+            for line in file:
+                for code in SEPARATORS.split(line):
+                    if code:
+                        yield code
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+
+def parse_scenario(text):
+    """'START:ROUTES' -> (start_postal, num_routes)"""
+    start_postal, _, num_routes = text.partition(':')
+    if not start_postal or not num_routes.isdigit() or int(num_routes) < 1:
+        raise argparse.ArgumentTypeError(f"Scenario '{text}' should look like START_POSTAL:NUM_ROUTES")
+    return start_postal.strip(), int(num_routes)
+
+
+def read_scenarios(path):
+    """Scenarios from a CSV with start_postal and num_routes columns"""
+    with open(path, newline='') as file:
+        return [(row['start_postal'].strip(), int(row['num_routes'])) for row in csv.DictReader(file)]
+
+
+# Per-process state for pool workers: the warm coordinates, known failures and optimizer options
+_worker_state = {}
+
+
+def _init_worker(postal_codes, coordinates, failed, options):
+    _worker_state.update(postal_codes=postal_codes, coordinates=coordinates, failed=failed, options=options)
+
+
+def run_scenario(start_postal, num_routes, postal_codes=None, coordinates=None, options=None, failed=None):
+    """
+    Plan one scenario from already-geocoded coordinates.
+    Returns (CompactPlan, timings); module-level so pool workers can run it,
+    and the plan's arrays pickle far smaller than lists of strings.
+    """
+    postal_codes = postal_codes if postal_codes is not None else _worker_state['postal_codes']
+    coordinates = coordinates if coordinates is not None else _worker_state['coordinates']
+    failed = failed if failed is not None else _worker_state.get('failed', ())
+    options = options if options is not None else _worker_state['options']
+
+    started = time.perf_counter()
+    optimizer = PostalRouteOptimizer(postal_codes, num_groups=num_routes, **options)
+    # Seed the warm coordinates and the codes that failed to geocode, so this scenario never geocodes
+    optimizer.coord_cache.update(coordinates)
+    optimizer.resolver.failed.update(failed)
+    optimizer.optimize_route(start_postal)
+    plan = optimizer.to_plan()
+    elapsed = time.perf_counter() - started
+    return plan, {
+        'start_postal': start_postal,
+        'num_routes': num_routes,
+        'routes': len(plan),
+        'stops': plan.stop_count,
+        'optimize_seconds': round(elapsed, 3),
+        'local_search_seconds': round(sum(stats['elapsed'] for stats in optimizer.local_search_stats), 3)
+    }
+
+
+def write_results(plan, timing, out_dir, formats):
+    """Write one scenario's plan as <start>_<routes>.json / .csv under out_dir"""
+    name = f"{timing['start_postal']}_{timing['num_routes']}"
+    written = []
+    if 'json' in formats:
+        path = os.path.join(out_dir, f'{name}.json')
+        with open(path, 'w') as file:
+            json.dump({'timing': timing, 'plan': plan.to_dict()}, file)
+        written.append(path)
+    if 'csv' in formats:
+        path = os.path.join(out_dir, f'{name}.csv')
+        with open(path, 'w', newline='') as file:
+            for chunk in iter_csv(plan_rows(plan)):
+                file.write(chunk)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help="Postal code files, or '-' for stdin")
+    parser.add_argument('--scenario', type=parse_scenario, action='append', default=[],
+                        help="START_POSTAL:NUM_ROUTES (repeatable)")
+    parser.add_argument('--scenarios', help="CSV file with start_postal,num_routes columns")
+    parser.add_argument('--out', default='results', help="Output directory")
+    parser.add_argument('--format', nargs='+', choices=('json', 'csv'), default=['json'])
+    parser.add_argument('--workers', type=int, default=1, help="Processes for running scenarios in parallel")
+    parser.add_argument('--distance-metric', default='postal', choices=('postal', 'haversine', 'ors'))
+    parser.add_argument('--clustering', default='auto',
+                        choices=('auto', 'kmeans', 'minibatch', 'balanced', 'sector'))
+    parser.add_argument('--local-search', help="e.g. 2opt+oropt")
+    parser.add_argument('--local-search-time', type=float, default=1.0)
+    parser.add_argument('--route-workers', type=int, default=1,
+                        help="Processes for routing each scenario's clusters in parallel")
+    args = parser.parse_args(argv)
+
+    scenarios = list(args.scenario)
+    if args.scenarios:
+        scenarios.extend(read_scenarios(args.scenarios))
+    if not scenarios:
+        parser.error("give at least one --scenario or a --scenarios file")
+
+    started = time.perf_counter()
+    # Stream the input into unique sites; the per-stop list below shares one string per site
+    stops = StopIndex(read_postal_codes(args.inputs))
+    if not stops.total:
+        parser.error("no postal codes were read")
+    postal_codes = [stops.sites[site] for site in stops.inverse.tolist()]
+    options = {
+        'distance_metric': args.distance_metric,
+        'clustering': args.clustering,
+        'local_search': args.local_search,
+        'local_search_time': args.local_search_time,
+        'route_workers': args.route_workers
+    }
+
+    # Geocode every stop and start point once; all scenarios share the result.
+    # Clustering dependencies load in the background meanwhile (and are inherited by forked workers)
+    preload = preload_in_background()
+    geocode_started = time.perf_counter()
+    warm = PostalRouteOptimizer(stops.sites, num_groups=1)
+    all_codes = stops.sites + [start for start, _ in scenarios]
+    warm.resolver.resolve_many(all_codes)
+    coordinates = dict(warm.coord_cache)
+    failed = set(warm.resolver.failed)
+    geocode_seconds = time.perf_counter() - geocode_started
+    print(f"Geocoded {len(coordinates)}/{len(set(all_codes))} codes in {geocode_seconds:.2f}s "
+          f"({warm.resolver.stats})", file=sys.stderr)
+
+    preload.join()
+    os.makedirs(args.out, exist_ok=True)
+    timings = []
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(postal_codes, coordinates, failed, options)) as executor:
+            futures = [executor.submit(run_scenario, start, routes) for start, routes in scenarios]
+            for future in futures:
+                plan, timing = future.result()
+                write_results(plan, timing, args.out, args.format)
+                timings.append(timing)
+    else:
+        for start, routes in scenarios:
+            plan, timing = run_scenario(start, routes, postal_codes, coordinates, options, failed)
+            write_results(plan, timing, args.out, args.format)
+            timings.append(timing)
+
+    summary = {
+        'postal_codes': len(postal_codes),
+        'scenarios': timings,
+        'geocode_seconds': round(geocode_seconds, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'workers': args.workers
+    }
+    with open(os.path.join(args.out, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+
+    print(f"{'start':>8} {'routes':>7} {'planned':>8} {'stops':>7} {'seconds':>8}", file=sys.stderr)
+    for timing in timings:
+        print(f"{timing['start_postal']:>8} {timing['num_routes']:>7} {timing['routes']:>8} "
+              f"{timing['stops']:>7} {timing['optimize_seconds']:>8.2f}", file=sys.stderr)
+    print(f"Total {summary['total_seconds']:.2f}s for {len(timings)} scenarios "
+          f"(geocoding {summary['geocode_seconds']:.2f}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from collections import defaultdict
+
+import numpy as np
+
+from distance_matrix import haversine_matrix, haversine_pairs, nearest_neighbour_order
+
+# Partition for codes that aren't six digits and so have no postal sector
+UNKNOWN_SECTOR = -1
+
+
+def postal_sector(postal_code):
+    """The first two digits of a six-digit postal code as an int, else UNKNOWN_SECTOR"""
+    code = str(postal_code).strip()
+    if len(code) == 6 and code.isdigit():
+        return int(code[:2])
+    return UNKNOWN_SECTOR
+
+
+def partition_by_sector(postal_codes):
+    """{sector: [code, ...]} in ascending sector order, codes in input order"""
+    partitions = defaultdict(list)
+    for code in postal_codes:
+        partitions[postal_sector(code)].append(code)
+    return {sector: partitions[sector] for sector in sorted(partitions)}
+
+
+def _coords(codes, coord_lookup):
+    """(n, 2) coordinates of codes, NaN where a code has none"""
+    coords = np.full((len(codes), 2), np.nan)
+    for i, code in enumerate(codes):
+        point = coord_lookup.get(code)
+        if point is not None:
+            coords[i] = point
+    return coords
+
+
+def order_sectors(partitions, coord_lookup, start_postal):
+    """
+    Cheap inter-sector ordering: a nearest-neighbour tour over the sector centroids,
+    from start_postal's coordinates (or the first sector if it has none). Sectors
+    without any coordinates go last. Returns [(sector, entry), ...] in visiting order.
+
+    entry is the code each sector's route should start nearest to: start_postal
+    for the first sector, then the previous sector's stop nearest this sector's
+    centroid. That is not necessarily where the previous sector's route ends, but
+    it doesn't depend on that route, so sectors can be routed in parallel.
+    """
+    sectors = list(partitions)
+    coords = {sector: _coords(partitions[sector], coord_lookup) for sector in sectors}
+    located = [sector for sector in sectors if not np.isnan(coords[sector]).all()]
+    centroids = {sector: np.nanmean(coords[sector], axis=0) for sector in located}
+
+    start_point = coord_lookup.get(start_postal)
+    if located:
+        points = [centroids[sector] for sector in located]
+        if start_point is not None:
+            order = [i - 1 for i in nearest_neighbour_order(haversine_matrix([start_point] + points), 0)[1:]]
+        else:
+            order = nearest_neighbour_order(haversine_matrix(points), 0)
+        located = [located[i] for i in order]
+    visits = located + [sector for sector in sectors if sector not in centroids]
+
+    entries = [start_postal]
+    for previous, sector in zip(visits, visits[1:]):
+        if sector not in centroids or previous not in centroids:
+            entries.append(partitions[previous][0])
+            continue
+        known = np.flatnonzero(~np.isnan(coords[previous][:, 0]))
+        distances = haversine_pairs(coords[previous][known], np.broadcast_to(centroids[sector], (len(known), 2)))
+        entries.append(partitions[previous][known[int(np.argmin(distances))]])
+    return list(zip(visits, entries))
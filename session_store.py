@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jobs import DEFAULT_JOB_TTL_SECONDS
+from plan_model import CompactPlan
+from sqlite_cache import SQLiteDatabase
+
+# Plans are kept for a working day unless told otherwise (SESSION_TTL_SECONDS)
+DEFAULT_TTL_SECONDS = 8 * 3600
+# Most plans held at once before the least recently used is evicted (SESSION_MAX_ENTRIES)
+DEFAULT_MAX_ENTRIES = 100
+DEFAULT_STORE_PATH = 'sessions.db'
+
+
+class MemorySessionStore:
+    """
+    Per-process plan store: an LRU bounded by entry count, with entries
+    expiring ttl_seconds after they were last written.
+    Plans are CompactPlans (a handful of arrays), so a hundred of them cost
+    little next to one optimizer with live HTTP clients.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # session_id -> (expires_at, plan)
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the plan for session_id, or None if missing/expired"""
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, plan = entry
+            if expires_at <= time.time():
+                del self.entries[session_id]
+                return None
+            self.entries.move_to_end(session_id)
+            return plan
+
+    def put(self, session_id, plan):
+        with self.lock:
+            self.entries[session_id] = (time.time() + self.ttl_seconds, plan)
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteSessionStore(SQLiteDatabase):
+    """
+    Plan store shared by every worker process (e.g. under multi-process gunicorn).
+    Plans are stored as CompactPlan.to_bytes() blobs with the same LRU size bound
+    and TTL as the in-memory store; last_used_at is bumped on every read.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            plan BLOB NOT NULL,
+            last_used_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used_at)",
+    )
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        super().__init__(path or os.getenv('SESSION_STORE_PATH', DEFAULT_STORE_PATH))
+
+    def get(self, session_id):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT plan FROM sessions WHERE session_id = ? AND expires_at > ?",
+            (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE sessions SET last_used_at = ? WHERE session_id = ?", (now, session_id))
+        return CompactPlan.from_bytes(row[0])
+
+    def put(self, session_id, plan):
+        now = time.time()
+        with self.write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, plan, last_used_at, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, plan.to_bytes(), now, now + self.ttl_seconds)
+            )
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            # Evict the least recently used plans beyond max_entries
+            conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, session_id):
+        with self.write() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SQLiteJobStore(SQLiteDatabase):
+    """
+    Status of optimize jobs (to_dict() plus the result summary once done), shared
+    by every worker process so a poll or cancel can land on any of them.
+    A cancel for a job running in another process is left as a flag that the
+    running process picks up the next time it publishes progress.
+    Jobs are forgotten ttl_seconds after their last update.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)",
+    )
+
+    def __init__(self, path=None, ttl_seconds=DEFAULT_JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        super().__init__(path or os.getenv('SESSION_STORE_PATH', DEFAULT_STORE_PATH))
+
+    def get(self, job_id):
+        """The job's last published state as a dict, or None if unknown or expired"""
+        row = self._connect().execute(
+            "SELECT state FROM jobs WHERE job_id = ? AND updated_at > ?",
+            (job_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, job_id, state):
+        now = time.time()
+        with self.write() as conn:
+            # Upsert rather than replace, so a pending cancel flag survives progress updates
+            conn.execute(
+                "INSERT INTO jobs (job_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (job_id, json.dumps(state), now)
+            )
+            conn.execute("DELETE FROM jobs WHERE updated_at <= ?", (now - self.ttl_seconds,))
+
+    def request_cancel(self, job_id):
+        """Flag the job for cancellation; returns its state, or None if it isn't known"""
+        with self.write() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        row = self._connect().execute(
+            "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+
+# One store per process, chosen by SESSION_STORE ('memory' or 'sqlite')
+_default_session_store = None
+_default_session_store_lock = threading.Lock()
+
+
+def get_default_session_store():
+    """Return the process-wide session store, creating it on first use"""
+    global _default_session_store
+    with _default_session_store_lock:
+        if _default_session_store is None:
+            backend = os.getenv('SESSION_STORE', 'memory')
+            options = {
+                'max_entries': int(os.getenv('SESSION_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                'ttl_seconds': float(os.getenv('SESSION_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+            }
+            if backend == 'sqlite':
+                _default_session_store = SQLiteSessionStore(**options)
+            elif backend == 'memory':
+                _default_session_store = MemorySessionStore(**options)
+            else:
+                raise ValueError(f"Unknown SESSION_STORE backend '{backend}'")
+        return _default_session_store
+
+
+# Jobs are only shared when plans are (SESSION_STORE=sqlite); one store per process
+_default_job_store = None
+_default_job_store_lock = threading.Lock()
+
+
+def get_default_job_store():
+    """
+    Return the process-wide SQLiteJobStore when SESSION_STORE=sqlite, creating it
+    on first use, or None when jobs only need to be visible to this process
+    """
+    global _default_job_store
+    with _default_job_store_lock:
+        if _default_job_store is None and os.getenv('SESSION_STORE', 'memory') == 'sqlite':
+            _default_job_store = SQLiteJobStore(
+                ttl_seconds=float(os.getenv('JOB_TTL_SECONDS', DEFAULT_JOB_TTL_SECONDS))
+            )
+        return _default_job_store
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+class SpatialIndex:
+    """
+    KD-tree for repeated nearest-unvisited queries.
+    Removed points stay in the tree and are skipped at query time; once more
+    than rebuild_fraction of the tree is dead it is rebuilt from the live points.
+    Exact ties go to the lowest point index, matching argmin over a distance row.
+    """
+
+    def __init__(self, points, p=2, rebuild_fraction=0.5, leafsize=16):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.p = p
+        self.rebuild_fraction = rebuild_fraction
+        self.leafsize = leafsize
+        self.alive = np.ones(len(self.points), dtype=bool)
+        self.remaining = len(self.points)
+        self._build(np.arange(len(self.points)))
+
+    def _build(self, ids):
+        from scipy.spatial import cKDTree
+
+        self.tree_ids = ids
+        self.tree = cKDTree(self.points[ids], leafsize=self.leafsize) if len(ids) else None
+        self.dead_in_tree = 0
+
+    def remove(self, index):
+        if not self.alive[index]:
+            return
+        self.alive[index] = False
+        self.remaining -= 1
+        self.dead_in_tree += 1
+        if self.remaining and self.dead_in_tree > self.rebuild_fraction * len(self.tree_ids):
+            self._build(np.flatnonzero(self.alive))
+
+    def nearest(self, point):
+        """Index of the nearest live point, or -1 once every point is removed"""
+        if not self.remaining:
+            return -1
+        size = len(self.tree_ids)
+        # Enough candidates to usually get past the removed points around us
+        k = min(size, 8 + 2 * self.dead_in_tree // max(1, self.remaining))
+        while True:
+            distances, positions = self.tree.query(point, k=max(k, 1), p=self.p)
+            distances = np.atleast_1d(distances)
+            positions = np.atleast_1d(positions)
+            found = positions < size
+            ids = self.tree_ids[positions[found]]
+            distances = distances[found]
+            live = self.alive[ids]
+            if live.any():
+                best = distances[live].min()
+                # Every point tied at `best` is among the candidates unless the cut-off is itself tied
+                if distances[-1] > best or k >= size:
+                    return int(ids[live & (distances == best)].min())
+            elif k >= size:
+                return -1
+            k = min(size, k * 4)
+
+
+def _first_unvisited(distances, neighbours, alive, complete):
+    """
+    Nearest live entry in one precomputed neighbour row (sorted by distance),
+    lowest index among ties. -1 if the row can't decide: every entry is
+    visited, or a tie may continue past the end of an incomplete row.
+    """
+    for j, neighbour in enumerate(neighbours):
+        if alive[neighbour]:
+            best = distances[j]
+            for k in range(j + 1, len(neighbours)):
+                if distances[k] != best:
+                    return neighbour
+                if alive[neighbours[k]] and neighbours[k] < neighbour:
+                    neighbour = neighbours[k]
+            return neighbour if complete else -1
+    return -1
+
+
+def spatial_nearest_neighbour_order(points, start=0, p=2, index=None, candidates=16):
+    """
+    Nearest-neighbour tour with the same result as nearest_neighbour_order on
+    the full distance matrix, without building the matrix. Pass an existing
+    SpatialIndex over points to reuse it (start is removed from it).
+    One batched query finds every stop's `candidates` nearest stops up front;
+    the tree is only searched again when all of them have been visited.
+    """
+    n = len(points)
+    if not n:
+        return []
+    index = index if index is not None else SpatialIndex(points, p=p)
+    k = min(candidates, n)
+    distances, positions = index.tree.query(points, k=k, p=p)
+    distances = np.reshape(distances, (n, k)).tolist()
+    neighbours = index.tree_ids[np.reshape(positions, (n, k))].tolist()
+    complete = k >= len(index.tree_ids)
+
+    order = [start]
+    index.remove(start)
+    current = start
+    for _ in range(n - 1):
+        nearest = _first_unvisited(distances[current], neighbours[current], index.alive, complete)
+        current = nearest if nearest >= 0 else index.nearest(points[current])
+        index.remove(current)
+        order.append(current)
+    return order
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteDatabase:
+    """
+    Base class for the on-disk caches.
+    Uses WAL mode so many worker processes can read at the same time while
+    writes are serialized through SQLite's single writer lock.
+    Subclasses set SCHEMA to their CREATE TABLE statements.
+    """
+
+    SCHEMA = ()
+
+    def __init__(self, path):
+        self.path = path
+        # sqlite3 connections can't be shared between threads or across fork()
+        self._local = threading.local()
+        conn = self._connect()
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Run statements in one transaction, taking the write lock up front so writers queue up"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
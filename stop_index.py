@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class StopIndex:
+    """
+    The unique sites in a list of postal codes (e.g. many patients at one clinic
+    block), with how many times and at which input positions each occurs.
+    Geocoding, clustering and routing work on sites; expand() turns a route of
+    sites back into one entry per input stop.
+    """
+
+    __slots__ = ('sites', 'inverse', 'counts', 'index', '_order', '_offsets')
+
+    def __init__(self, postal_codes):
+        self.index = {}
+        # inverse[i] is the site of input stop i; sites are numbered in first-seen order
+        self.inverse = np.fromiter(
+            (self.index.setdefault(code, len(self.index)) for code in postal_codes), dtype=np.int64
+        )
+        self.sites = list(self.index)
+        self.counts = np.bincount(self.inverse, minlength=len(self.sites))
+        # Input positions grouped by site (CSR), in input order within each site
+        self._order = np.argsort(self.inverse, kind='stable')
+        self._offsets = np.concatenate(([0], np.cumsum(self.counts)))
+
+    def __len__(self):
+        return len(self.sites)
+
+    @property
+    def total(self):
+        """Number of input stops, repeats included"""
+        return len(self.inverse)
+
+    def count(self, code):
+        """How many input stops are at this site (1 for codes that weren't in the input)"""
+        site = self.index.get(code)
+        return 1 if site is None else int(self.counts[site])
+
+    def positions(self, code):
+        """Input positions of every stop at this site, in input order"""
+        site = self.index[code]
+        return self._order[self._offsets[site]:self._offsets[site + 1]]
+
+    def expand(self, route):
+        """A route of sites with each site repeated once per input stop there"""
+        expanded = []
+        for code in route:
+            expanded.extend([code] * self.count(code))
+        return expanded